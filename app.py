@@ -1,9 +1,120 @@
+import time
+
+startup_started = time.perf_counter()
+
+import importlib
+import logging
+import threading
 import dash
 from dash import Dash, html, dcc, Input, Output
 import dash_bootstrap_components as dbc
-from pages import worldmap, charts, bar_charts, index_page
+from flask import request
+
+dash_imported = time.perf_counter()
+
+import metrics
+from cache import FigureCache
+
+metrics.observe_startup('import:dash', dash_imported - startup_started)
+metrics.observe_startup('import:metrics', time.perf_counter() - dash_imported)
+
+with metrics.startup_stage('import:background'):
+    import background
+with metrics.startup_stage('import:compression'):
+    import compression
+with metrics.startup_stage('import:data_reload'):
+    import data_reload
+with metrics.startup_stage('import:export_api'):
+    import export_api
+with metrics.startup_stage('import:geo_assets'):
+    import geo_assets
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+server = app.server
+compression.init_app(server)
+geo_assets.init_app(server)
+export_api.init_app(server)
+metrics.init_app(server)
+
+# Модули страниц вместе с pandas и plotly импортируются при первом обращении к дашборду,
+# данные загружаются при первом callback'е, которому они нужны
+pages = {
+    '/world-map': 'pages.worldmap',
+    '/line-chart': 'pages.charts',
+    '/bar-charts': 'pages.bar_charts',
+    '/anomalies': 'pages.anomalies',
+}
+loaded_pages = {}
+pages_lock = threading.RLock()
+server_ready = False
+# Страница дашборда и граф callback'ов; остальные маршруты (/metrics, /api, /topojson, статика) страниц не требуют
+graph_endpoints = {app.config.routes_pathname_prefix + name
+                   for name in ('', '<path:path>', '_dash-dependencies')}
+callback_endpoint = app.config.routes_pathname_prefix + '_dash-update-component'
+# Макеты страниц зависят только от данных, поэтому собираются один раз на версию данных
+layout_cache = FigureCache(maxsize=len(pages), name='layout')
+
+logger = logging.getLogger(__name__)
+
+
+def load_page(module_name):
+    with pages_lock:
+        if module_name not in loaded_pages:
+            with metrics.startup_stage('import:data'):
+                importlib.import_module('data')
+            with metrics.startup_stage(f'import:{module_name}'):
+                module = importlib.import_module(module_name)
+            if hasattr(module, 'register_callbacks'):
+                module.register_callbacks(app)
+            loaded_pages[module_name] = module
+    return loaded_pages[module_name]
+
+
+def setup_server():
+    # Dash при настройке сервера переносит cancel фоновых расчетов в отдельные callback'и, поэтому
+    # настройка выполняется только после регистрации callback'ов всех страниц
+    global server_ready
+    with pages_lock:
+        if server_ready:
+            return
+        for module_name in pages.values():
+            load_page(module_name)
+        app._setup_server()
+        server_ready = True
+    # Отмена, заданная после настройки сервера, молча не работает; о такой ошибке пишется в лог
+    missing = background.missing_cancel(app.callback_map)
+    if missing:
+        logger.error('Отмена фоновых callback\'ов не зарегистрирована: %s', ', '.join(missing))
+
+
+def load_callback_page():
+    # При нескольких процессах вызов callback'а может попасть в процесс, который граф callback'ов
+    # не отдавал: страницы загружаются по одной, пока не найдется callback запрошенного выхода
+    output = (request.get_json(silent=True) or {}).get('output')
+    if output in app.callback_map:
+        return
+    for module_name in pages.values():
+        load_page(module_name)
+        if output in app.callback_map:
+            return
+    # Callback'и отмены появляются только при настройке сервера
+    setup_server()
+
+
+def load_pages_for_request():
+    if request.endpoint in graph_endpoints:
+        setup_server()
+    elif request.endpoint == callback_endpoint:
+        load_callback_page()
+
+
+# Настройка сервера, которую Dash зарегистрировал на первый запрос любого вида, заменяется
+# загрузкой страниц только для маршрутов дашборда
+before_request = server.before_request_funcs[None]
+before_request[before_request.index(app._setup_server)] = load_pages_for_request
+
+# Снимок данных закрепляется за запросом после загрузки страниц
+data_reload.init_app(server)
 
 app.layout = html.Div([
     dbc.NavbarSimple(
@@ -11,7 +122,8 @@ app.layout = html.Div([
             dbc.NavItem(dbc.NavLink("Главная", href="/")),
             dbc.NavItem(dbc.NavLink("Карта безработицы", href="/world-map")),
             dbc.NavItem(dbc.NavLink("Динамика безработицы", href="/line-chart")),
-            dbc.NavItem(dbc.NavLink("Отклонения по континентам", href="/bar-charts"))
+            dbc.NavItem(dbc.NavLink("Отклонения по континентам", href="/bar-charts")),
+            dbc.NavItem(dbc.NavLink("Аномалии и тренды", href="/anomalies"))
         ],
         brand="Дашборд по безработице во всем мире",
         color="primary",
@@ -26,19 +138,20 @@ app.layout = html.Div([
 
 @app.callback(Output('page-content', 'children'),
               [Input('url', 'pathname')])
+@metrics.instrument('display_page')
 def display_page(pathname):
-    if pathname == '/world-map':
-        return worldmap.get_layout()
-    elif pathname == '/line-chart':
-        return charts.get_layout()
-    elif pathname == '/bar-charts':
-        return bar_charts.get_layout()
+    if pathname in pages:
+        module = load_page(pages[pathname])
+        version = importlib.import_module('data').get_dataset().version
+        layout = layout_cache.get(pathname, version)
+        if layout is None:
+            layout = module.get_layout()
+            layout_cache.set(pathname, version, layout)
+        return layout
     else:
-        return index_page.index_page
+        return load_page('pages.index_page').index_page
 
-worldmap.register_callbacks(app)
-charts.register_callbacks(app)
-bar_charts.register_callbacks(app)
+metrics.observe_startup('app', time.perf_counter() - startup_started)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,16 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    charts: (function () {
+        const RANGE_DELAY = 300;
+        let lastCall = 0;
+
+        return {
+            // Диапазон лет уходит на сервер только после паузы в движении слайдера
+            debounce_range: function (value) {
+                const call = ++lastCall;
+                return new Promise(resolve => setTimeout(() => {
+                    resolve(call === lastCall ? value : window.dash_clientside.no_update);
+                }, RANGE_DELAY));
+            }
+        };
+    })()
+});
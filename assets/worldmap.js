@@ -0,0 +1,66 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    worldmap: (function () {
+        const MISSING_RATE = -32768;
+
+        function decode(matrix) {
+            const bytes = Uint8Array.from(atob(matrix.data), c => c.charCodeAt(0));
+            const values = matrix.dtype === 'int16' ? new Int16Array(bytes.buffer) : new Float32Array(bytes.buffer);
+            return {values: values, columns: matrix.shape[1]};
+        }
+
+        function column(matrix, index, transform) {
+            const result = [];
+            for (let row = 0; row < matrix.values.length / matrix.columns; row++) {
+                result.push(transform(matrix.values[row * matrix.columns + index]));
+            }
+            return result;
+        }
+
+        // Пропуски передаются как null, как их сериализует сервер
+        function toRate(value) {
+            return value === MISSING_RATE ? null : value / 100;
+        }
+
+        // Население в миллионах с точностью до десятых, как в фигуре с сервера
+        function toMillions(value) {
+            return Number.isNaN(value) ? null : Math.round(value / 100) / 10;
+        }
+
+        function sameKey(data, figure) {
+            const meta = figure && figure.layout && figure.layout.meta;
+            return Boolean(meta) && JSON.stringify(meta.key) === JSON.stringify(data.key);
+        }
+
+        return {
+            switch_year: function (year, yearSwitching, data, figure) {
+                const noUpdate = window.dash_clientside.no_update;
+                if (yearSwitching !== 'client' || !data || !sameKey(data, figure)) {
+                    return [noUpdate, year];
+                }
+                const index = data.years.indexOf(year);
+                const rates = column(decode(data.rates), index, toRate);
+                const population = column(decode(data.population), index, toMillions);
+
+                const choropleth = Object.assign({}, figure.data[0]);
+                const labels = Object.assign({}, figure.data[1]);
+                if (data.key[0] === 'countries') {
+                    choropleth.z = rates;
+                    choropleth.customdata = population.map((value, i) => [value, data.continents[i]]);
+                    labels.customdata = rates;
+                } else {
+                    const continentRates = column(decode(data.continent_rates), index, toRate);
+                    const continentPopulation = column(decode(data.continent_population), index, toMillions);
+                    choropleth.z = data.continent_codes.map(code => continentRates[code]);
+                    choropleth.customdata = population.map((value, i) =>
+                        [rates[i], value, data.continents[i], continentPopulation[data.continent_codes[i]]]);
+                    labels.customdata = continentRates;
+                }
+
+                const layout = Object.assign({}, figure.layout, {
+                    title: Object.assign({}, figure.layout.title, {text: 'Уровень безработицы в ' + year + ' году'})
+                });
+                return [Object.assign({}, figure, {data: [choropleth, labels], layout: layout}), noUpdate];
+            }
+        };
+    })()
+});
@@ -0,0 +1,76 @@
+import os
+import shutil
+import threading
+import time
+
+from dash import DiskcacheManager
+
+import metrics
+
+# Фоновые callback'и требуют пакетов dash[diskcache]; без них тяжелые callback'и выполняются в процессе сервера
+try:
+    import diskcache
+    import multiprocess
+    import psutil
+except ImportError:
+    diskcache = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Пустое значение BACKGROUND_CACHE_DIR отключает фоновое выполнение
+BACKGROUND_DIR = os.environ.get('BACKGROUND_CACHE_DIR', os.path.join(BASE_DIR, '.background_cache'))
+# Как часто браузер опрашивает сервер о готовности результата, мс
+POLL_INTERVAL = int(os.environ.get('BACKGROUND_POLL_INTERVAL', 250))
+# Сколько замеров фоновых заданий процесс сервера хранит до выдачи /metrics
+MAX_JOB_SAMPLES = 10000
+METRICS_DIR = os.path.join(BACKGROUND_DIR, 'metrics')
+
+_server_queue = (None, None)
+_server_queue_lock = threading.Lock()
+
+manager = DiskcacheManager(diskcache.Cache(BACKGROUND_DIR)) if diskcache is not None and BACKGROUND_DIR else None
+
+
+def server_queue_name():
+    # У каждого процесса сервера своя очередь замеров заданий, которые он запустил; время запуска
+    # в имени не дает замерам прежнего запуска с тем же pid попасть в гистограммы нового процесса
+    global _server_queue
+    with _server_queue_lock:
+        if _server_queue[0] != os.getpid():
+            remove_stale_queues()
+            _server_queue = (os.getpid(), f'{os.getpid()}-{time.time_ns()}')
+        return _server_queue[1]
+
+
+def remove_stale_queues():
+    # Очереди завершившихся процессов сервера больше никто не прочитает
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        pid = name.split('-', 1)[0]
+        if not pid.isdigit() or not psutil.pid_exists(int(pid)):
+            shutil.rmtree(os.path.join(METRICS_DIR, name), ignore_errors=True)
+
+
+def open_job_queue(name):
+    # Очередь ограничена: если /metrics никто не опрашивает, старые замеры вытесняются новыми
+    return diskcache.Deque(directory=os.path.join(METRICS_DIR, name), maxlen=MAX_JOB_SAMPLES)
+
+
+if manager is not None:
+    metrics.job_queue_name = server_queue_name
+    metrics.open_job_queue = open_job_queue
+
+
+def callback_options(cancel=()):
+    # Каждый пересчет запускается отдельным процессом; renderer сообщает серверу о предыдущем
+    # незавершенном запуске того же callback, и его процесс завершается, не дожидаясь результата
+    if manager is None:
+        return {}
+    return {'background': True, 'manager': manager, 'interval': POLL_INTERVAL, 'cancel': list(cancel)}
+
+
+def missing_cancel(callback_map):
+    # Dash переносит cancel в отдельные callback'и при настройке сервера; оставшиеся cancel_inputs
+    # означают, что callback зарегистрирован позже и отмена для него не работает
+    return [output for output, spec in callback_map.items()
+            if (spec.get('background') or {}).get('cancel_inputs')]
@@ -0,0 +1,124 @@
+"""Замеры времени и пиковой памяти расчетов, стоящих за callback'ами дашборда.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.callbacks --scales 1 10 100 --extra-years 0 50
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+from data import Dataset, load_dataset
+from pages import bar_charts, charts, worldmap
+
+
+def scaled_dataset(base, scale, extra_years=0, seed=0):
+    # Каждая страна размножается на scale "регионов" с тем же кодом и шумом в значениях,
+    # ряды продлеваются в прошлое на extra_years лет
+    rng = np.random.default_rng(seed)
+    first_year = int(base.years[0])
+    years = [str(year) for year in range(first_year - extra_years, int(base.years[-1]) + 1)]
+
+    rates = np.concatenate([np.repeat(base.rates[:, :1], extra_years, axis=1), base.rates], axis=1)
+    rates = np.tile(rates, (scale, 1)).astype(np.float64)
+    if scale > 1:
+        rates = np.clip(rates + rng.normal(0, 0.5, rates.shape), 0, 100)
+    unemployment = pd.concat([base.countries] * scale, ignore_index=True)
+    region = np.repeat(np.arange(scale), len(base.countries))
+    unemployment['Country Name'] = [name if i == 0 else f'{name} / регион {i}'
+                                    for name, i in zip(unemployment['Country Name'], region)]
+    unemployment = pd.concat([unemployment, pd.DataFrame(rates.round(2), columns=years)], axis=1)
+
+    matched = ~np.isnan(base.population).all(axis=1)
+    population = pd.DataFrame(
+        np.concatenate([np.repeat(base.population[:, :1], extra_years, axis=1), base.population], axis=1)[matched],
+        columns=years,
+    )
+    population.insert(0, 'Numeric code', base.countries['Numeric code'][matched].to_numpy())
+    return Dataset.from_frames(unemployment, population, version=f'synthetic-{scale}-{extra_years}')
+
+
+def cases(dataset):
+    last_year = dataset.years[-2]
+    first_year = dataset.years[0]
+    countries = list(dataset.country_index)[:10]
+    return {
+        'update_map/countries': lambda: worldmap.render_map(dataset, 'countries', [], last_year).to_json(),
+        'update_map/continents': lambda: worldmap.render_map(dataset, 'continents', [], last_year).to_json(),
+        'update_charts': lambda: to_json_plotly(charts.build_charts(
+            dataset, countries, [int(first_year), int(last_year)])),
+        'update_charts/all': lambda: to_json_plotly(charts.build_overview_charts(
+            dataset, [int(first_year), int(last_year)])),
+        'update_top_countries_global_table': lambda: to_json_plotly(bar_charts.build_top_countries_global_table(
+            bar_charts.get_top_countries_global(dataset, int(last_year)), int(last_year))),
+        'update_continent_charts': lambda: to_json_plotly(continent_charts(dataset, int(last_year))),
+        'get_top_countries_global': lambda: bar_charts.get_top_countries_global(dataset, int(last_year)),
+        'get_top_countries_continent': lambda: bar_charts.get_top_countries_continent(dataset, 'Europe', int(last_year)),
+    }
+
+
+def continent_charts(dataset, year):
+    df_filtered = bar_charts.get_continent_slice(dataset, 'Europe', year)
+    top_countries_df = bar_charts.get_top_countries_continent(dataset, 'Europe', year)
+    return (bar_charts.build_top_countries_continent_table(top_countries_df, year),
+            bar_charts.build_deviation_bar_chart(dataset, 'Europe', year, df_filtered),
+            bar_charts.build_change_deviation_bar_chart(dataset, 'Europe', year, df_filtered))
+
+
+def measure(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return float(np.median(timings)), peak
+
+
+def run(scales, extra_years, repeat, only=None):
+    base = load_dataset()
+    results = []
+    for scale in scales:
+        for extra in extra_years:
+            dataset = base if scale == 1 and extra == 0 else scaled_dataset(base, scale, extra)
+            for name, func in cases(dataset).items():
+                if only and name not in only:
+                    continue
+                seconds, peak = measure(func, repeat)
+                results.append({'callback': name, 'rows': len(dataset.countries), 'years': len(dataset.years),
+                                'ms': round(seconds * 1000, 3), 'peak_mb': round(peak / 2 ** 20, 2)})
+                print(f"{name:<36} {results[-1]['rows']:>8} {results[-1]['years']:>5} "
+                      f"{results[-1]['ms']:>10.2f} {results[-1]['peak_mb']:>9.2f}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='во сколько раз увеличить число строк')
+    parser.add_argument('--extra-years', type=int, nargs='+', default=[0],
+                        help='на сколько лет продлить ряды в прошлое')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='замерять только указанные callback')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    args = parser.parse_args()
+
+    print(f"{'callback':<36} {'rows':>8} {'years':>5} {'ms':>10} {'peak MB':>9}")
+    results = run(args.scales, args.extra_years, args.repeat, args.only)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Нагрузочный прогон: запросы callback'ов дашборда к локально запущенному серверу.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.load run --workers 1 4 --concurrency 1 8 32 --duration 10
+    python -m benchmarks.load record traffic.jsonl
+    python -m benchmarks.load run --traffic traffic.jsonl --workers 4 --concurrency 16
+
+Без --traffic тела запросов генерируются по графу callback'ов приложения со случайными,
+но допустимыми значениями. Несколько рабочих процессов запускаются через gunicorn,
+как в развертывании; без него доступен только один процесс (flask run с потоками).
+"""
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import background
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPDATE_PATH = '/_dash-update-component'
+
+# Callback'и, запросы к которым воспроизводятся по умолчанию
+CALLBACKS = ('update_map', 'update_charts', 'update_top_countries_global_table', 'update_continent_charts',
+             'update_anomalies')
+PERCENTILES = (50, 95, 99)
+
+
+def load_app():
+    # Все страницы загружаются заранее, чтобы граф callback'ов был полным
+    import app
+
+    for module_name in app.pages.values():
+        app.load_page(module_name)
+    return app.app
+
+
+def callback_specs(dash_app):
+    specs = {}
+    for output, spec in dash_app.callback_map.items():
+        name = getattr(spec.get('callback'), '__name__', None)
+        if name:
+            specs[name] = dict(spec, output=output)
+    return specs
+
+
+def request_body(spec, values, changed):
+    # Тело запроса в том виде, в каком его отправляет браузер
+    def parse(output):
+        component_id, prop = output.rsplit('.', 1)
+        return {'id': component_id, 'property': prop}
+
+    output = spec['output']
+    outputs = [parse(item) for item in output[2:-2].split('...')] if output.startswith('..') else parse(output)
+    return {
+        'output': output,
+        'outputs': outputs,
+        'inputs': [dict(item, value=values[f"{item['id']}.{item['property']}"]) for item in spec['inputs']],
+        'state': [dict(item, value=values[f"{item['id']}.{item['property']}"]) for item in spec['state']],
+        'changedPropIds': [changed],
+    }
+
+
+def generated_values(name, dataset, rng):
+    # Значения компонентов, которые мог бы выбрать пользователь, и свойство, вызвавшее callback
+    countries = list(dataset.country_index)
+    continents = list(dataset.continent_rows)
+    year = rng.randint(1992, 2020)
+    if name == 'update_map':
+        view_mode = rng.choice(['countries', 'continents'])
+        return {
+            'view-mode.value': view_mode,
+            'selected-continents-store.data': rng.sample(continents, rng.randint(0, 2)),
+            'map-render-year.data': str(year),
+            'year-dropdown.value': str(year),
+        }, 'map-render-year.data'
+    if name == 'update_charts':
+        first = rng.randint(1991, 2019)
+        return {
+            'selected-countries-store.data': rng.sample(countries, rng.randint(1, 10)),
+            'year-range-store.data': [first, rng.randint(first + 1, 2020)],
+            'compare-all-switch.value': rng.random() < 0.1,
+            'rendered-countries.data': None,
+        }, 'year-range-store.data'
+    if name == 'update_top_countries_global_table':
+        return {'year-dropdown.value': year}, 'year-dropdown.value'
+    if name == 'update_continent_charts':
+        return {'continent-dropdown.value': rng.choice(continents), 'year-dropdown.value': year}, 'year-dropdown.value'
+    if name == 'update_anomalies':
+        return {
+            'anomaly-metric-dropdown.value': rng.choice(list(dataset.indicators.matrices)),
+            'anomaly-year-dropdown.value': year,
+            'anomaly-continent-dropdown.value': rng.choice([None] + continents),
+            'anomaly-order.value': rng.choice(['desc', 'asc']),
+        }, 'anomaly-year-dropdown.value'
+    raise ValueError(f'Нет генератора запросов для callback {name}')
+
+
+def generate_traffic(callbacks, count, seed=0):
+    import data
+
+    specs = callback_specs(load_app())
+    dataset = data.get_dataset()
+    rng = random.Random(seed)
+    traffic = []
+    for i in range(count):
+        name = callbacks[i % len(callbacks)]
+        values, changed = generated_values(name, dataset, rng)
+        traffic.append((name, request_body(specs[name], values, changed)))
+    return traffic
+
+
+def read_traffic(path, callbacks):
+    with open(path) as file:
+        traffic = [(record['callback'], record['body']) for record in map(json.loads, file)]
+    return [(name, body) for name, body in traffic if name in callbacks]
+
+
+def record(path, port):
+    # Дашборд работает как обычно, а тела запросов к callback'ам дописываются в файл
+    from flask import request
+
+    dash_app = load_app()
+    specs = {spec['output']: name for name, spec in callback_specs(dash_app).items()}
+    lock = threading.Lock()
+
+    @dash_app.server.before_request
+    def record_request():
+        # Опрос результатов фоновых callback'ов не записывается, при воспроизведении он повторяется сам
+        if request.path.endswith(UPDATE_PATH) and 'cacheKey' not in request.args:
+            body = request.get_json(silent=True) or {}
+            name = specs.get(body.get('output'))
+            if name:
+                with lock, open(path, 'a') as file:
+                    file.write(json.dumps({'callback': name, 'body': body}, ensure_ascii=False) + '\n')
+
+    print(f'Запись запросов в {path}, дашборд: http://127.0.0.1:{port}/', flush=True)
+    dash_app.run(port=port)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def running_server(workers, threads):
+    port = free_port()
+    # В консоль попадают только предупреждения и ошибки сервера, без журнала запросов
+    if importlib.util.find_spec('gunicorn'):
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                   '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:server']
+        stderr = None
+    elif workers == 1:
+        command = [sys.executable, '-m', 'flask', '--app', 'app:server', 'run', '--port', str(port), '--with-threads']
+        stderr = subprocess.DEVNULL
+    else:
+        raise SystemExit('Для нескольких рабочих процессов нужен gunicorn (pip install gunicorn)')
+    process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=stderr)
+    try:
+        wait_ready(port, process)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def wait_ready(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Сервер завершился с кодом {process.returncode}')
+        with contextlib.suppress(OSError):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        time.sleep(0.2)
+    raise SystemExit('Сервер не ответил за отведенное время')
+
+
+def post(connection, path, body):
+    connection.request('POST', path, body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def send(connection, body, poll_interval):
+    # Для фонового callback'а результат запрашивается повторно, как это делает браузер;
+    # задержка включает все опросы до получения ответа
+    payload = json.dumps(body).encode()
+    status, content = post(connection, UPDATE_PATH, payload)
+    size = len(content)
+    while status == 200:
+        reply = json.loads(content)
+        if 'cacheKey' not in reply or 'response' in reply:
+            break
+        time.sleep(poll_interval)
+        query = urllib.parse.urlencode({'cacheKey': reply['cacheKey'], 'job': reply['job']})
+        status, content = post(connection, f'{UPDATE_PATH}?{query}', payload)
+        size += len(content)
+    return status in (200, 204), size
+
+
+def replay(port, traffic, concurrency, duration, poll_interval):
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        samples = []
+        i = offset
+        while time.perf_counter() < deadline:
+            name, body = traffic[i % len(traffic)]
+            start = time.perf_counter()
+            try:
+                ok, size = send(connection, body, poll_interval)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok, size = False, 0
+            samples.append((name, time.perf_counter() - start, ok, size))
+            i += concurrency
+        connection.close()
+        with lock:
+            results.extend(samples)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def percentile(values, q):
+    # Ближайший ранг по отсортированной выборке
+    return values[max(0, min(len(values) - 1, round(q / 100 * len(values)) - 1))]
+
+
+def summarize(samples, elapsed):
+    groups = {}
+    for name, seconds, ok, size in sorted(samples):
+        groups.setdefault(name, []).append((seconds, ok, size))
+    groups['all'] = [(seconds, ok, size) for _, seconds, ok, size in samples]
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(seconds for seconds, ok, _ in group if ok)
+        summary[name] = {
+            'requests': len(group),
+            'errors': sum(not ok for _, ok, _ in group),
+            'rps': round(len(latencies) / elapsed, 2),
+            'kb': round(sum(size for _, ok, size in group if ok) / max(len(latencies), 1) / 1024, 1),
+            **{f'p{q}_ms': round(percentile(latencies, q) * 1000, 1) if latencies else None for q in PERCENTILES},
+        }
+    return summary
+
+
+def run(args):
+    callbacks = args.callbacks or list(CALLBACKS)
+    if args.traffic:
+        traffic = read_traffic(args.traffic, callbacks)
+    else:
+        traffic = generate_traffic(callbacks, args.pool, args.seed)
+    if not traffic:
+        raise SystemExit('Нет запросов для воспроизведения')
+    random.Random(args.seed).shuffle(traffic)
+
+    print(f"{'workers':>7} {'conc':>5} {'callback':<36} {'req':>7} {'err':>5} {'rps':>8} {'KB':>7} "
+          + ' '.join(f'{f"p{q} ms":>9}' for q in PERCENTILES))
+    results = []
+    for workers in args.workers:
+        with running_server(workers, args.threads) as port:
+            # Прогрев: каждый процесс загружает страницы и данные при первых запросах
+            replay(port, traffic, workers, args.warmup, args.poll_interval)
+            for concurrency in args.concurrency:
+                samples, elapsed = replay(port, traffic, concurrency, args.duration, args.poll_interval)
+                for name, row in summarize(samples, elapsed).items():
+                    results.append({'workers': workers, 'threads': args.threads, 'concurrency': concurrency,
+                                    'callback': name, **row})
+                    print(f"{workers:>7} {concurrency:>5} {name:<36} {row['requests']:>7} {row['errors']:>5} "
+                          f"{row['rps']:>8.2f} {row['kb']:>7.1f} "
+                          + ' '.join(f'{row[f"p{q}_ms"] if row[f"p{q}_ms"] is not None else "-":>9}'
+                                     for q in PERCENTILES), flush=True)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='записать запросы к callback\'ам при работе с дашбордом')
+    record_parser.add_argument('output', help='файл JSON Lines, запросы дописываются в конец')
+    record_parser.add_argument('--port', type=int, default=8050)
+
+    run_parser = commands.add_parser('run', help='воспроизвести запросы при разной нагрузке')
+    run_parser.add_argument('--traffic', help='записанные запросы; без него запросы генерируются')
+    run_parser.add_argument('--callbacks', nargs='+', help=f'воспроизводить только указанные из {", ".join(CALLBACKS)}')
+    run_parser.add_argument('--workers', type=int, nargs='+', default=[1], help='число рабочих процессов сервера')
+    run_parser.add_argument('--threads', type=int, default=1, help='потоков в рабочем процессе gunicorn')
+    run_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                            help='число одновременных клиентов')
+    run_parser.add_argument('--duration', type=float, default=10, help='длительность каждого замера в секундах')
+    run_parser.add_argument('--warmup', type=float, default=3, help='прогрев сервера перед замерами в секундах')
+    run_parser.add_argument('--pool', type=int, default=500, help='сколько запросов сгенерировать')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--poll-interval', type=float, default=background.POLL_INTERVAL / 1000,
+                            help='период опроса результата фонового callback\'а в секундах')
+    run_parser.add_argument('--json', help='сохранить результаты в файл')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.output, args.port)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
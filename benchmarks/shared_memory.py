@@ -0,0 +1,78 @@
+"""Проверка, что рабочие процессы делят одну физическую копию матриц датасета.
+
+Запуск из корня репозитория (нужен Linux с /proc):
+
+    python -m benchmarks.shared_memory --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+
+import numpy as np
+
+MAPPING_HEADER = re.compile(r'^[0-9a-f]+-[0-9a-f]+ ')
+
+
+def mapped_usage(directory):
+    # Rss - резидентные страницы файлов кэша в процессе, Pss - доля процесса с учетом разделения страниц
+    usage = {'Rss': 0, 'Pss': 0, 'Private_Clean': 0, 'Private_Dirty': 0}
+    inside = False
+    with open('/proc/self/smaps') as file:
+        for line in file:
+            if MAPPING_HEADER.match(line):
+                parts = line.split(maxsplit=5)
+                inside = len(parts) == 6 and parts[5].strip().startswith(directory)
+            elif inside:
+                field, value = line.split(':', 1)
+                if field in usage:
+                    usage[field] += int(value.split()[0])
+    return usage
+
+
+def worker(barrier, results):
+    import data
+
+    dataset = data.get_dataset()
+    # Обращение ко всем страницам матриц, как при обработке запросов
+    matrices = [dataset.rates, dataset.population, dataset.rank_order, dataset.continent_rank_blocks]
+    for matrix in matrices + list(dataset.indicators.matrices.values()):
+        np.asarray(matrix).sum()
+    barrier.wait()
+    results.put((os.getpid(), type(dataset.rates).__name__, mapped_usage(os.path.abspath(data.CACHE_DIR))))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    # Процессы запускаются заново, а не через fork, как независимые рабочие процессы сервера
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(barrier, results)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    usages = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"{'pid':>8} {'matrix':>8} {'Rss kB':>8} {'Pss kB':>8} {'Private kB':>11}")
+    for pid, kind, usage in usages:
+        private = usage['Private_Clean'] + usage['Private_Dirty']
+        print(f"{pid:>8} {kind:>8} {usage['Rss']:>8} {usage['Pss']:>8} {private:>11}")
+
+    rss = max(usage['Rss'] for _, _, usage in usages)
+    total_pss = sum(usage['Pss'] for _, _, usage in usages)
+    # При одной физической копии сумма долей всех процессов равна размеру одной копии
+    shared = rss > 0 and total_pss <= rss + args.workers and all(kind == 'memmap' for _, kind, _ in usages)
+    print(f'одна копия: {rss} kB, сумма Pss по {args.workers} процессам: {total_pss} kB -> '
+          f"{'общая копия' if shared else 'частные копии'}")
+    return 0 if shared else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
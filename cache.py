@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Пустое значение RENDER_CACHE_DIR отключает дисковый кэш прогретых состояний
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', os.path.join(BASE_DIR, '.render_cache'))
+
+# Именованные кэши процесса, их счетчики публикуются на /metrics
+caches = {}
+
+
+def atomic_write(path, content):
+    # Файл появляется атомарно: читатели не видят его недописанным, прерванная запись не оставляет
+    # поврежденного файла
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def code_version(sources):
+    # Отпечаток исходных файлов, от которых зависит результат рендеринга
+    digest = hashlib.sha1()
+    for source in sources:
+        with open(source, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+class DiskCache:
+    # Фигуры, подготовленные командой прогрева, в виде JSON; каталог версии зависит
+    # от версии данных и от исходного кода, который строит фигуры
+    def __init__(self, directory, sources=()):
+        self.directory = directory
+        self.code_version = code_version(sources)
+
+    def version_dir(self, version):
+        return os.path.join(self.directory, f'{version}-{self.code_version}')
+
+    def path(self, key, version):
+        name = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self.version_dir(version), f'{name}.json')
+
+    def get(self, key, version):
+        if version is None:
+            return None
+        try:
+            with open(self.path(key, version), encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, version, value):
+        # Фигуры plotly и массивы numpy сериализуются кодировщиком plotly; возвращается размер файла
+        from plotly.io.json import to_json_plotly
+        content = to_json_plotly(value)
+        atomic_write(self.path(key, version), content)
+        return len(content)
+
+    def prune(self, version):
+        # Удаляются каталоги прежних версий данных и кода
+        if not os.path.isdir(self.directory):
+            return
+        current = os.path.basename(self.version_dir(version))
+        for name in os.listdir(self.directory):
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class FigureCache:
+    # LRU-кэш готовых фигур и таблиц, сбрасывается при переходе на новую версию данных;
+    # при промахе значение ищется в дисковом кэше, если он задан
+    def __init__(self, maxsize=128, ttl=None, disk=None, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.version = None
+        # Версии, с которых кэш уже перешел: запросы, закрепленные на прежнем снимке во время
+        # перезагрузки данных, получают промах и не сбрасывают значения новой версии
+        self._retired = set()
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if name is not None:
+            caches[name] = self
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self.version and version not in self._retired:
+                if self.version is not None:
+                    self._retired.add(self.version)
+                self._items.clear()
+                self.version = version
+            item = self._items.get(key) if version == self.version else None
+            if item is not None and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self._items[key]
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+        value = self.disk.get(key, version) if self.disk is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.set(key, version, value)
+        return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            if version != self.version:
+                return
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'disk_hits': self.disk_hits, 'misses': self.misses}
+
+
+def cache_from_env(prefix, maxsize, ttl=None, sources=()):
+    # Дисковый уровень подключается, если переданы исходные файлы, от которых зависят фигуры
+    ttl = os.environ.get(f'{prefix}_CACHE_TTL', ttl)
+    disk = DiskCache(os.path.join(RENDER_CACHE_DIR, prefix.lower()), sources) if RENDER_CACHE_DIR and sources else None
+    return FigureCache(maxsize=int(os.environ.get(f'{prefix}_CACHE_SIZE', maxsize)),
+                       ttl=float(ttl) if ttl is not None else None, disk=disk, name=prefix.lower())
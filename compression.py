@@ -0,0 +1,45 @@
+import gzip
+import os
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжимаются JSON-ответы Dash; статические файлы отдаются как есть
+ROUTES = ('/_dash-update-component', '/_dash-layout', '/_dash-dependencies')
+# Короткие ответы не сжимаются: заголовки и накладные расходы съедают выигрыш
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress(body):
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br', brotli.compress(body, quality=BROTLI_QUALITY)
+    if accepted['gzip']:
+        return 'gzip', gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return None, body
+
+
+def init_app(server):
+    # Хук регистрируется раньше хука метрик и поэтому выполняется после него:
+    # размер ответа callback'а в метриках остается размером до сжатия
+    @server.after_request
+    def compress_response(response):
+        route = next((route for route in ROUTES if request.path.endswith(route)), None)
+        if route is None or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        body = response.get_data()
+        encoding, encoded = compress(body) if len(body) >= MIN_SIZE else (None, body)
+        metrics.observe_transfer(route, len(body), len(encoded))
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.set_data(encoded)
+            response.headers['Content-Encoding'] = encoding
+        return response
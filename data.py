@@ -1,5 +1,372 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
 import pandas as pd
 
-df = pd.read_csv('unemployment_analysis.csv', sep=',')
-all_countries = df['Country Name'].unique()
-print(all_countries.size)
\ No newline at end of file
+from indicators import METRICS, Indicators
+from search import SearchIndex
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UNEMPLOYMENT_PATH = os.path.join(BASE_DIR, 'unemployment_analysis.csv')
+POPULATION_PATH = os.path.join(BASE_DIR, 'World_Population_2020.csv')
+# Пустое значение DATA_CACHE_DIR отключает колоночный кэш
+CACHE_DIR = os.environ.get('DATA_CACHE_DIR', os.path.join(BASE_DIR, '.data_cache'))
+CACHE_FORMAT = 3
+# Годы и колонки, на которые опираются страницы дашборда
+REQUIRED_YEARS = [str(year) for year in range(1991, 2021)]
+REQUIRED_COLUMNS = ['Country Name', 'Country Code', 'Continent', 'Numeric code']
+
+logger = logging.getLogger(__name__)
+
+
+class Dataset:
+    def __init__(self, countries, years, rates, population, unmatched_countries=(), version=None, rank_index=None,
+                 indicator_matrices=None):
+        self.version = version
+        # Годовые колонки хранятся одной непрерывной матрицей страна × год
+        self.years = list(years)
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+        self.rates = rates
+
+        self.countries = countries
+        self.country_index = {country: i for i, country in enumerate(self.countries['Country Name'])}
+        self.continents = list(self.countries['Continent'].unique())
+        self.continent_codes = pd.Index(self.continents).get_indexer(self.countries['Continent'])
+        self.continent_rows = {
+            continent: np.flatnonzero(self.continent_codes == i) for i, continent in enumerate(self.continents)
+        }
+
+        self.population = population
+        self.unmatched_countries = list(unmatched_countries)
+
+        self.continent_cube = self._build_continent_cube()
+        # Индексы рангов по размеру сопоставимы с матрицей, поэтому тоже могут читаться из кэша
+        self.rank_order, self.continent_rank_blocks = rank_index or self._build_rank_index()
+        self.continent_rank_order = {}
+        offset = 0
+        for continent, rows in self.continent_rows.items():
+            self.continent_rank_order[continent] = self.continent_rank_blocks[:, offset:offset + len(rows)]
+            offset += len(rows)
+        self.indicator_matrices = indicator_matrices
+
+    @classmethod
+    def from_frames(cls, unemployment, population, version=None):
+        years = [column for column in unemployment.columns if column.isdigit()]
+        countries = unemployment.drop(columns=years).reset_index(drop=True)
+        rates = np.ascontiguousarray(unemployment[years].to_numpy(dtype=np.float32))
+        aligned, unmatched = align_population(countries, years, population)
+        if unmatched:
+            logger.warning('Нет данных о населении для %d стран: %s%s', len(unmatched),
+                           ', '.join(unmatched[:10]), ' ...' if len(unmatched) > 10 else '')
+        return cls(countries, years, rates, aligned, unmatched, version)
+
+    def _build_continent_cube(self):
+        # Показатели по каждой паре (континент, год), пересчитываются при каждой загрузке данных
+        rates = self.rates.astype(np.float64).round(2)
+        population = self.population.astype(np.float64)
+        changes = np.full(rates.shape, np.nan)
+        changes[:, 1:] = rates[:, 1:] - rates[:, :-1]
+
+        shape = (len(self.continents), len(self.years))
+        cube = {column: np.full(shape, np.nan) for column in
+                ('Unemployment_Rate', 'Total_Population', 'Mean_Rate', 'Mean_Change')}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i, rows in enumerate(self.continent_rows.values()):
+                unemployed = np.nansum(rates[rows] * population[rows] / 100, axis=0)
+                total_population = np.nansum(population[rows], axis=0)
+                cube['Unemployment_Rate'][i] = np.round(unemployed / total_population * 100, 2)
+                cube['Total_Population'][i] = total_population
+                cube['Mean_Rate'][i] = np.nanmean(rates[rows], axis=0)
+                cube['Mean_Change'][i, 1:] = np.nanmean(changes[rows, 1:], axis=0)
+        return cube
+
+    def _build_rank_index(self):
+        # Для каждого года строки упорядочены по убыванию безработицы, пропуски в конце
+        rank_order = np.argsort(-self.rates.T, axis=1, kind='stable').astype(np.int32)
+        continent_rank_blocks = np.concatenate([
+            rows[np.argsort(-self.rates[rows].T, axis=1, kind='stable')] for rows in self.continent_rows.values()
+        ], axis=1).astype(np.int32)
+        return rank_order, continent_rank_blocks
+
+    def top_rows(self, year, n=10, offset=0, continent=None):
+        order = self.rank_order if continent is None else self.continent_rank_order[continent]
+        return order[self.year_index[str(year)], offset:offset + n]
+
+    def continent_stats(self, year):
+        column = self.year_index[str(year)]
+        stats = pd.DataFrame({'Continent': self.continents})
+        for name, values in self.continent_cube.items():
+            stats[name] = values[:, column]
+        return stats
+
+    def continent_stat(self, name, continent, year):
+        return self.continent_cube[name][self.continents.index(continent), self.year_index[str(year)]]
+
+    def rate(self, year, rows=None):
+        # В CSV значения даны с точностью до сотых, округление убирает шум float32
+        column = self.rates[:, self.year_index[str(year)]]
+        if rows is not None:
+            column = column[rows]
+        return column.astype(np.float64).round(2)
+
+    def population_for(self, year, rows=None):
+        column = self.population[:, self.year_index[str(year)]]
+        if rows is not None:
+            column = column[rows]
+        return column.astype(np.float64)
+
+    def rows_for(self, countries):
+        return np.array(sorted(self.country_index[country] for country in countries
+                               if country in self.country_index), dtype=np.intp)
+
+    @functools.cached_property
+    def country_search(self):
+        # Индекс поиска строится при первом запросе и живет вместе со снимком данных
+        return SearchIndex(self.countries['Country Name'])
+
+    @functools.cached_property
+    def indicators(self):
+        # Производные матрицы (изменения, скользящие средние, z-оценки) берутся из кэша данных,
+        # без него считаются один раз на снимок
+        return Indicators(self, self.indicator_matrices)
+
+    def filter_rows(self, countries=None, continents=None):
+        # Пустой фильтр означает все строки; неизвестные страны и континенты пропускаются
+        rows = self.rows_for(countries) if countries else np.arange(len(self.countries))
+        if continents:
+            codes = [self.continents.index(continent) for continent in continents if continent in self.continents]
+            rows = rows[np.isin(self.continent_codes[rows], codes)]
+        return rows
+
+    def frame(self, years, rows=None, with_population=False):
+        index = np.arange(len(self.countries)) if rows is None else np.asarray(rows)
+        columns = {column: self.countries[column].to_numpy()[index] for column in self.countries.columns}
+        for year in years:
+            columns[str(year)] = self.rate(year, index)
+        if with_population:
+            for year in years:
+                columns[f'{year}_population'] = self.population_for(year, index)
+        return pd.DataFrame(columns, index=index)
+
+
+def align_population(countries, years, population):
+    # Соединение по 'Numeric code' выполняется один раз при загрузке:
+    # строки матрицы населения совпадают со строками матрицы безработицы
+    positions = pd.Index(population['Numeric code']).get_indexer(countries['Numeric code'])
+    matched = positions >= 0
+    year_index = {year: i for i, year in enumerate(years)}
+    population_years = [year for year in years if year in population.columns]
+
+    aligned = np.full((len(countries), len(years)), np.nan, dtype=np.float32)
+    aligned[np.ix_(matched, [year_index[year] for year in population_years])] = \
+        population[population_years].to_numpy(dtype=np.float32)[positions[matched]]
+    unmatched = countries.loc[~matched, 'Country Name'].tolist()
+    return aligned, unmatched
+
+
+def cache_path(version):
+    return os.path.join(CACHE_DIR, f'v{CACHE_FORMAT}-{version}')
+
+
+def write_cache(dataset):
+    # Матрицы и колонки справочника сохраняются отдельными .npy, каталог появляется атомарно
+    path = cache_path(dataset.version)
+    if os.path.isdir(path):
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=CACHE_DIR)
+    try:
+        np.save(os.path.join(tmp_path, 'rates.npy'), np.ascontiguousarray(dataset.rates))
+        np.save(os.path.join(tmp_path, 'population.npy'), np.ascontiguousarray(dataset.population))
+        np.save(os.path.join(tmp_path, 'rank_order.npy'), np.ascontiguousarray(dataset.rank_order))
+        np.save(os.path.join(tmp_path, 'continent_rank_order.npy'), np.ascontiguousarray(dataset.continent_rank_blocks))
+        for metric, matrix in dataset.indicators.matrices.items():
+            np.save(os.path.join(tmp_path, f'indicator_{metric}.npy'), matrix)
+        columns = []
+        for i, column in enumerate(dataset.countries.columns):
+            values = dataset.countries[column]
+            text = not pd.api.types.is_numeric_dtype(values)
+            array = values.fillna('').to_numpy(dtype=str) if text else values.to_numpy()
+            np.save(os.path.join(tmp_path, f'column{i}.npy'), array, allow_pickle=False)
+            columns.append({'name': column, 'file': f'column{i}.npy'})
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'years': dataset.years, 'columns': columns,
+                       'unmatched_countries': dataset.unmatched_countries}, file, ensure_ascii=False)
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith('v') and os.path.join(CACHE_DIR, name) != path:
+            shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+    return path
+
+
+def read_cache(version):
+    path = cache_path(version)
+    if not os.path.isfile(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as file:
+            meta = json.load(file)
+        # Матрицы отображаются в память: страницы файла делят все процессы на машине
+        rates = np.load(os.path.join(path, 'rates.npy'), mmap_mode='r')
+        population = np.load(os.path.join(path, 'population.npy'), mmap_mode='r')
+        rank_index = (np.load(os.path.join(path, 'rank_order.npy'), mmap_mode='r'),
+                      np.load(os.path.join(path, 'continent_rank_order.npy'), mmap_mode='r'))
+        indicator_matrices = {metric: np.load(os.path.join(path, f'indicator_{metric}.npy'), mmap_mode='r')
+                              for metric in METRICS}
+        countries = pd.DataFrame({column['name']: np.load(os.path.join(path, column['file']), allow_pickle=False)
+                                  for column in meta['columns']})
+    except (OSError, ValueError, KeyError):
+        logger.warning('Кэш данных %s поврежден, данные будут прочитаны из CSV', path, exc_info=True)
+        return None
+    return Dataset(countries, meta['years'], rates, population, meta['unmatched_countries'], version, rank_index,
+                   indicator_matrices)
+
+
+_dataset = None
+_dataset_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_pinned_dataset = contextvars.ContextVar('pinned_dataset', default=None)
+
+
+def source_version():
+    # Версия данных меняется при любом изменении исходных файлов
+    stats = [os.stat(path) for path in (UNEMPLOYMENT_PATH, POPULATION_PATH)]
+    return '-'.join(f'{stat.st_mtime_ns:x}{stat.st_size:x}' for stat in stats)
+
+
+def read_csv_dataset(version=None):
+    # Снимок проверяется сразу после чтения CSV: отклоненные данные не попадают в кэш
+    # и не вытесняют из него предыдущую версию
+    unemployment = pd.read_csv(UNEMPLOYMENT_PATH, sep=',')
+    population = pd.read_csv(POPULATION_PATH, sep=',')
+    validate_frames(unemployment, population)
+    dataset = Dataset.from_frames(unemployment, population, version)
+    validate_dataset(dataset)
+    return dataset
+
+
+@contextlib.contextmanager
+def cache_lock():
+    # CSV конвертирует один процесс, остальные ждут и подключаются к готовому кэшу
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, '.lock'), 'w') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield
+
+
+def load_dataset(use_cache=True):
+    version = source_version()
+    if not use_cache or not CACHE_DIR:
+        return read_csv_dataset(version)
+
+    dataset = read_cache(version)
+    if dataset is not None:
+        return dataset
+    try:
+        with cache_lock():
+            dataset = read_cache(version)
+            if dataset is None:
+                write_cache(read_csv_dataset(version))
+                dataset = read_cache(version)
+    except OSError:
+        logger.warning('Не удалось сохранить кэш данных в %s', CACHE_DIR, exc_info=True)
+    # Все процессы работают с отображенными в память файлами кэша, а не с частными копиями
+    return dataset if dataset is not None else read_csv_dataset(version)
+
+
+def validate_frames(unemployment, population):
+    # Колонки проверяются до сборки снимка: без них сборка падает с KeyError, а не с понятной ошибкой
+    missing = [column for column in REQUIRED_COLUMNS + REQUIRED_YEARS if column not in unemployment.columns]
+    if missing:
+        raise ValueError(f'В данных нет колонок: {", ".join(missing)}')
+    if 'Numeric code' not in population.columns:
+        raise ValueError('В данных о населении нет колонки: Numeric code')
+
+
+def validate_dataset(dataset):
+    # Снимок подключается, только если на нем могут работать все страницы
+    if not len(dataset.countries):
+        raise ValueError('В данных нет стран')
+    duplicated = dataset.countries['Country Name'][dataset.countries['Country Name'].duplicated()].tolist()
+    if duplicated:
+        raise ValueError(f'Страны повторяются: {", ".join(duplicated[:10])}')
+    rates = np.asarray(dataset.rates)
+    if np.isnan(rates).all():
+        raise ValueError('В данных нет значений безработицы')
+    with np.errstate(invalid='ignore'):
+        if ((rates < 0) | (rates > 100)).any():
+            raise ValueError('Уровень безработицы вне диапазона 0-100%')
+    if np.isnan(np.asarray(dataset.population)).all():
+        raise ValueError('Данные о населении не сопоставлены ни с одной страной')
+
+
+def get_dataset():
+    global _dataset
+    pinned = _pinned_dataset.get()
+    if pinned is not None:
+        return pinned
+    if _dataset is None:
+        with _dataset_lock:
+            if _dataset is None:
+                _dataset = load_dataset()
+    return _dataset
+
+
+def load_worker_dataset():
+    # Инициализатор процессов пула (прогрев, отчет): снимок загружается один раз до первой задачи
+    get_dataset()
+
+
+def set_dataset(dataset):
+    global _dataset
+    with _dataset_lock:
+        _dataset = dataset
+
+
+def pin_dataset():
+    # Запрос до конца работает со снимком, который был актуален при его начале,
+    # даже если за это время данные перезагрузились
+    return _pinned_dataset.set(get_dataset())
+
+
+def unpin_dataset(token):
+    _pinned_dataset.reset(token)
+
+
+def reload_dataset(force=False):
+    # Новый снимок собирается и проверяется в стороне от текущего и подменяет его одним присваиванием;
+    # кэши фигур привязаны к версии данных и сбрасываются при первом обращении с новой версией
+    with _reload_lock:
+        version = source_version()
+        if not force and _dataset is not None and _dataset.version == version:
+            return False
+        dataset = load_dataset()
+        previous = _dataset.version if _dataset is not None else None
+        set_dataset(dataset)
+    logger.info('Данные перезагружены: версия %s -> %s', previous, dataset.version)
+    return True
+
+
+if __name__ == '__main__':
+    # Предварительная конвертация CSV в колоночный кэш
+    logging.basicConfig(level=logging.INFO)
+    print(write_cache(read_csv_dataset(source_version())))
@@ -0,0 +1,86 @@
+import hmac
+import importlib
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, jsonify, request
+
+import metrics
+
+# Период проверки исходных CSV в секундах, 0 отключает наблюдение
+RELOAD_INTERVAL = float(os.environ.get('DATA_RELOAD_INTERVAL', 60))
+# Без токена маршрут ручной перезагрузки не регистрируется
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+logger = logging.getLogger(__name__)
+
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+
+
+def watch(interval):
+    data = importlib.import_module('data')
+    last_seen = data.source_version()
+    rejected = None
+    while True:
+        time.sleep(interval)
+        try:
+            version = data.source_version()
+        except OSError:
+            logger.warning('Исходные файлы данных недоступны', exc_info=True)
+            continue
+        # Изменение подхватывается, когда файлы не менялись целый период: копирование успело завершиться
+        if version == last_seen and version not in (data.get_dataset().version, rejected):
+            try:
+                data.reload_dataset()
+            except Exception:
+                rejected = version
+                logger.exception('Новые данные не загружены, дашборд продолжает работать на версии %s',
+                                 data.get_dataset().version)
+        last_seen = version
+
+
+def start_watcher():
+    # Поток наблюдения запускается в каждом рабочем процессе, в том числе созданном через fork
+    global _watcher_pid
+    with _watcher_lock:
+        if RELOAD_INTERVAL <= 0 or _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    threading.Thread(target=watch, args=(RELOAD_INTERVAL,), name='data-reload', daemon=True).start()
+
+
+def init_app(server):
+    # Снимок закрепляется только за вызовами callback'ов, остальные маршруты модуль data не импортируют
+    @server.before_request
+    def pin_dataset():
+        if request.path.endswith('/_dash-update-component'):
+            data = importlib.import_module('data')
+            start_watcher()
+            # Первый вызов callback'а в процессе загружает снимок данных
+            with metrics.startup_stage('load:dataset'):
+                g.dataset_token = data.pin_dataset()
+
+    @server.teardown_request
+    def unpin_dataset(exc):
+        token = g.pop('dataset_token', None)
+        if token is not None:
+            importlib.import_module('data').unpin_dataset(token)
+
+    if not ADMIN_TOKEN:
+        return
+
+    @server.route('/admin/reload-data', methods=['POST'])
+    def reload_data():
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return Response(status=403)
+        # Перезагрузка затрагивает только этот процесс, остальные подхватят файлы своим наблюдателем
+        data = importlib.import_module('data')
+        try:
+            reloaded = data.reload_dataset(force=request.args.get('force') == '1')
+        except ValueError as error:
+            return jsonify({'error': str(error), 'version': data.get_dataset().version}), 422
+        return jsonify({'reloaded': reloaded, 'version': data.get_dataset().version})
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets сразу для всех строк матрицы y (ряд × точка) с общей осью x.
+    # Первая и последняя точки сохраняются, из каждой корзины между ними выбирается точка,
+    # образующая наибольший треугольник с предыдущей выбранной точкой и средним следующей корзины
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    rows, size = y.shape
+    if threshold >= size or threshold < 3:
+        return np.broadcast_to(np.arange(size), (rows, size))
+
+    edges = (np.arange(threshold - 1) * (size - 2) / (threshold - 2)).astype(np.intp) + 1
+    edges[-1] = size - 1
+    selected = np.empty((rows, threshold), dtype=np.intp)
+    selected[:, 0] = 0
+    selected[:, -1] = size - 1
+    previous = np.zeros(rows, dtype=np.intp)
+    row_index = np.arange(rows)
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_values = y[:, end:next_end]
+        with np.errstate(invalid='ignore'):
+            next_y = np.nansum(next_values, axis=1) / (~np.isnan(next_values)).sum(axis=1)
+        prev_x = x[previous]
+        prev_y = y[row_index, previous]
+        area = np.abs((prev_x - next_x)[:, None] * (y[:, start:end] - prev_y[:, None])
+                      - (prev_x[:, None] - x[start:end]) * (next_y - prev_y)[:, None])
+        # Пропуски в ряду не выбираются, пока в корзине есть хотя бы одно значение
+        area[np.isnan(area)] = -1
+        previous = start + area.argmax(axis=1)
+        selected[:, bucket + 1] = previous
+    return selected
+
+
+def lttb(x, y, threshold):
+    # Прореженные координаты: x и y формы ряд × threshold
+    indices = lttb_indices(x, y, threshold)
+    return np.asarray(x)[indices], np.take_along_axis(np.asarray(y), indices, axis=1)
@@ -0,0 +1,162 @@
+import csv
+import hashlib
+import importlib
+import importlib.util
+import io
+
+from flask import Response, abort, jsonify, make_response, request
+
+# Arrow IPC доступен при установленном pyarrow, CSV отдается всегда;
+# сам pyarrow импортируется при первом запросе в этом формате
+ARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Ряды отдаются частями по CHUNK_ROWS стран, весь ответ в памяти не собирается
+CHUNK_ROWS = 256
+COLUMNS = ['Country Name', 'Country Code', 'Continent', 'Year', 'Unemployment_Rate', 'Population']
+# Ограничение размера ответа /api/anomalies
+MAX_ANOMALY_ROWS = 1000
+MIMETYPES = {'csv': 'text/csv; charset=utf-8', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+
+def fail(status, message):
+    abort(make_response(jsonify({'error': message}), status))
+
+
+def parse_query(dataset):
+    output_format = request.args.get('format', 'csv')
+    if output_format not in MIMETYPES:
+        fail(400, f'Неизвестный формат {output_format}, доступны: {", ".join(MIMETYPES)}')
+    if output_format == 'arrow' and not ARROW_AVAILABLE:
+        fail(406, 'Формат arrow недоступен: не установлен pyarrow')
+    try:
+        first = dataset.year_index[request.args.get('from', dataset.years[0])]
+        last = dataset.year_index[request.args.get('to', dataset.years[-1])]
+    except KeyError:
+        fail(400, f'Годы должны быть в диапазоне {dataset.years[0]}-{dataset.years[-1]}')
+    if first > last:
+        fail(400, 'Начальный год больше конечного')
+    countries = request.args.getlist('country')
+    continents = request.args.getlist('continent')
+    return output_format, countries, continents, first, last
+
+
+def parse_anomaly_query(dataset):
+    metrics = importlib.import_module('indicators').METRICS
+    metric = request.args.get('metric', 'change_zscore')
+    if metric not in metrics:
+        fail(400, f'Неизвестный показатель {metric}, доступны: {", ".join(metrics)}')
+    year = request.args.get('year', dataset.years[-1])
+    if year not in dataset.year_index:
+        fail(400, f'Годы должны быть в диапазоне {dataset.years[0]}-{dataset.years[-1]}')
+    try:
+        n = int(request.args.get('n', 10))
+    except ValueError:
+        n = 0
+    if not 1 <= n <= MAX_ANOMALY_ROWS:
+        fail(400, f'Параметр n должен быть от 1 до {MAX_ANOMALY_ROWS}')
+    continent = request.args.get('continent')
+    if continent is not None and continent not in dataset.continent_rows:
+        fail(400, f'Неизвестный континент {continent}')
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        fail(400, 'Порядок задается значением asc или desc')
+    return metric, year, n, continent, order
+
+
+def chunks(dataset, rows, first, last):
+    # Блоки строк страна × год в длинном формате: одна строка на пару (страна, год)
+    years = dataset.years[first:last + 1]
+    columns = dataset.countries[['Country Name', 'Country Code', 'Continent']]
+    for start in range(0, len(rows), CHUNK_ROWS):
+        block = rows[start:start + CHUNK_ROWS]
+        rates = dataset.rates[block, first:last + 1].astype('float64').round(2).tolist()
+        population = dataset.population[block, first:last + 1].astype('float64').tolist()
+        info = columns.iloc[block].itertuples(index=False)
+        records = [(name, code, continent, int(year),
+                    None if rate != rate else rate, None if people != people else people)
+                   for (name, code, continent), row_rates, row_population in zip(info, rates, population)
+                   for year, rate, people in zip(years, row_rates, row_population)]
+        yield records
+
+
+def stream_csv(dataset, rows, first, last):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for records in chunks(dataset, rows, first, last):
+        writer.writerows(records)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_arrow(dataset, rows, first, last):
+    pyarrow = importlib.import_module('pyarrow')
+    importlib.import_module('pyarrow.ipc')
+    schema = pyarrow.schema([
+        ('Country Name', pyarrow.string()), ('Country Code', pyarrow.string()), ('Continent', pyarrow.string()),
+        ('Year', pyarrow.int16()), ('Unemployment_Rate', pyarrow.float64()), ('Population', pyarrow.float64()),
+    ])
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for records in chunks(dataset, rows, first, last):
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(zip(*records), schema)],
+                schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def init_app(server):
+    # Выгрузка нужна редко, поэтому pandas и данные не импортируются до первого запроса к /api
+    @server.route('/api/series')
+    def export_series():
+        dataset = importlib.import_module('data').get_dataset()
+        output_format, countries, continents, first, last = parse_query(dataset)
+
+        # Ответ зависит только от версии данных и параметров запроса
+        key = repr((dataset.version, output_format, sorted(countries), sorted(continents), first, last))
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            rows = dataset.filter_rows(countries, continents)
+            stream = stream_csv if output_format == 'csv' else stream_arrow
+            response = Response(stream(dataset, rows, first, last), mimetype=MIMETYPES[output_format])
+            response.headers['Content-Disposition'] = f'attachment; filename=unemployment.{output_format}'
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    @server.route('/api/anomalies')
+    def export_anomalies():
+        # Страны с наибольшими (наименьшими) значениями показателя за год по готовым матрицам
+        dataset = importlib.import_module('data').get_dataset()
+        metric, year, n, continent, order = parse_anomaly_query(dataset)
+        etag = hashlib.sha1(repr((dataset.version, metric, year, n, continent, order)).encode()).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            indicators = dataset.indicators
+            rows = indicators.top_rows(metric, year, n, continent, ascending=order == 'asc')
+            countries = dataset.countries[['Country Name', 'Country Code', 'Continent']].iloc[rows]
+            values = {name: indicators.values(name, year, rows).round(4).tolist() for name in indicators.matrices}
+            response = jsonify({
+                'version': dataset.version, 'metric': metric, 'year': year,
+                'countries': [dict(zip(countries.columns, row), **{
+                    name: None if column[i] != column[i] else column[i] for name, column in values.items()
+                }) for i, row in enumerate(countries.itertuples(index=False))],
+            })
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    @server.route('/api/countries')
+    def export_countries():
+        dataset = importlib.import_module('data').get_dataset()
+        countries = dataset.countries[['Country Name', 'Country Code', 'Continent']]
+        return jsonify({'version': dataset.version, 'years': dataset.years,
+                        'countries': [dict(zip(countries.columns, row)) for row in countries.itertuples(index=False)]})
@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import urllib.request
+
+from flask import abort, send_from_directory
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TOPOJSON_DIR = os.path.join(BASE_DIR, 'assets', 'topojson')
+# Карта использует проекцию мира с разрешением по умолчанию 1:110 млн
+TOPOJSON_FILES = ('world_110m.json',)
+CDN_URL = 'https://cdn.plot.ly/un/'
+ROUTE = '/topojson'
+MAX_AGE = 365 * 24 * 60 * 60
+# Файлы геометрии лежат в репозитории; без них приложение запускается, только если явно разрешено
+# загружать геометрию с CDN (TOPOJSON_CDN_FALLBACK=1)
+CDN_FALLBACK = os.environ.get('TOPOJSON_CDN_FALLBACK', '') == '1'
+
+logger = logging.getLogger(__name__)
+
+
+def topojson_version():
+    # Отпечаток содержимого входит в URL, поэтому файлы можно кэшировать в браузере без перепроверки
+    digest = hashlib.sha1()
+    for name in TOPOJSON_FILES:
+        path = os.path.join(TOPOJSON_DIR, name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+@functools.lru_cache(maxsize=None)
+def topojson_url():
+    # Без локальных файлов браузер загружает геометрию с CDN Plotly, как раньше
+    version = topojson_version()
+    if version is None:
+        logger.warning('Нет файлов геометрии в %s, карта загрузит их с %s (python geo_assets.py)', TOPOJSON_DIR, CDN_URL)
+        return CDN_URL
+    return f'{ROUTE}/{version}/'
+
+
+def init_app(server):
+    if topojson_version() is None:
+        if not CDN_FALLBACK:
+            raise RuntimeError(f'Нет файлов геометрии карты в {TOPOJSON_DIR}: восстановите их из репозитория '
+                               f'или загрузите командой python geo_assets.py (TOPOJSON_CDN_FALLBACK=1 '
+                               f'разрешает загрузку с {CDN_URL})')
+        logger.error('Нет файлов геометрии в %s, карта загрузит их с %s', TOPOJSON_DIR, CDN_URL)
+
+    @server.route(f'{ROUTE}/<version>/<name>')
+    def topojson_file(version, name):
+        if name not in TOPOJSON_FILES:
+            abort(404)
+        response = send_from_directory(TOPOJSON_DIR, name, max_age=MAX_AGE, mimetype='application/json')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def download_topojson(url=CDN_URL):
+    os.makedirs(TOPOJSON_DIR, exist_ok=True)
+    for name in TOPOJSON_FILES:
+        path = os.path.join(TOPOJSON_DIR, name)
+        with urllib.request.urlopen(url + name) as response, open(path + '.tmp', 'wb') as file:
+            shutil.copyfileobj(response, file)
+        os.replace(path + '.tmp', path)
+        print(path)
+
+
+if __name__ == '__main__':
+    # Однократная загрузка геометрии в assets/topojson/ для развертываний без доступа в интернет
+    download_topojson()
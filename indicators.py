@@ -0,0 +1,81 @@
+import numpy as np
+
+# Окно скользящего среднего в годах
+ROLLING_WINDOW = 3
+
+METRICS = {
+    'rate': 'Уровень безработицы',
+    'change': 'Изменение за год',
+    'rolling_mean': f'Скользящее среднее за {ROLLING_WINDOW} года',
+    'zscore': 'Z-оценка уровня относительно истории страны',
+    'change_zscore': 'Z-оценка изменения относительно истории страны',
+    'continent_deviation': 'Отклонение от среднего по континенту',
+}
+
+
+def rolling_mean(values, window):
+    # Среднее за последние window лет по имеющимся значениям, первые window - 1 лет пустые
+    filled = np.concatenate([np.zeros((len(values), 1)), np.nan_to_num(values).cumsum(axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(values), 1)), (~np.isnan(values)).cumsum(axis=1)], axis=1)
+    result = np.full(values.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[:, window - 1:] = ((filled[:, window:] - filled[:, :-window])
+                                  / (counts[:, window:] - counts[:, :-window]))
+    return result
+
+
+def zscore(values):
+    # Отклонение от среднего по всей истории строки в единицах ее стандартного отклонения
+    counts = (~np.isnan(values)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(values, axis=1, keepdims=True) / counts
+        std = np.sqrt(np.nansum((values - mean) ** 2, axis=1, keepdims=True) / counts)
+        return (values - mean) / std
+
+
+def build_matrices(dataset, window=ROLLING_WINDOW):
+    # Матрицы считаются в float64 и хранятся в float32, как матрица безработицы в кэше данных
+    rates = dataset.rates.astype(np.float64).round(2)
+    change = np.full(rates.shape, np.nan)
+    change[:, 1:] = rates[:, 1:] - rates[:, :-1]
+    matrices = {
+        'rate': rates,
+        'change': change,
+        'rolling_mean': rolling_mean(rates, window),
+        'zscore': zscore(rates),
+        'change_zscore': zscore(change),
+        'continent_deviation': rates - dataset.continent_cube['Mean_Rate'][dataset.continent_codes],
+    }
+    return {metric: np.ascontiguousarray(matrix, dtype=np.float32) for metric, matrix in matrices.items()}
+
+
+class Indicators:
+    # Производные показатели в виде матриц страна × год; при работе с кэшем данных они посчитаны
+    # при его записи и отображаются в память, иначе считаются один раз для снимка данных
+    def __init__(self, dataset, matrices=None):
+        self.year_index = dataset.year_index
+        self.continent_rows = dataset.continent_rows
+        self.matrices = matrices if matrices is not None else build_matrices(dataset)
+
+    def __getitem__(self, metric):
+        return self.matrices[metric].astype(np.float64)
+
+    def values(self, metric, year, rows=None):
+        column = self.matrices[metric][:, self.year_index[str(year)]]
+        if rows is not None:
+            column = column[rows]
+        return column.astype(np.float64)
+
+    def top_rows(self, metric, year, n=10, continent=None, ascending=False):
+        # Строки с наибольшими (наименьшими) значениями за год, пропуски не попадают в выборку.
+        # Значения сравниваются с точностью до 4 знаков: шум float32 не меняет порядок равных значений
+        rows = np.arange(len(self.matrices[metric])) if continent is None else self.continent_rows[continent]
+        keys = self.values(metric, year, rows).round(4)
+        valid = ~np.isnan(keys)
+        rows, keys = rows[valid], keys[valid]
+        if not ascending:
+            keys = -keys
+        if n < len(rows):
+            part = np.argpartition(keys, n)[:n]
+            rows, keys = rows[part], keys[part]
+        return rows[np.argsort(keys, kind='stable')]
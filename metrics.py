@@ -0,0 +1,226 @@
+import contextlib
+import functools
+import logging
+import os
+import threading
+import time
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context, request
+
+import cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+logger = logging.getLogger(__name__)
+
+_startup = {}
+_durations = {}
+_sizes = {}
+_errors = {}
+_transfer = {}
+_lock = threading.Lock()
+# Процесс фонового callback'а пишет замеры в очередь процесса сервера, который его запустил,
+# а тот переносит их в свои гистограммы при выдаче /metrics (функции задаются в background.py)
+job_queue_name = None
+open_job_queue = None
+
+
+def observe_duration(callback, phase, seconds):
+    with _lock:
+        _durations.setdefault((callback, phase), Histogram(DURATION_BUCKETS)).observe(seconds)
+
+
+def observe_size(callback, size):
+    with _lock:
+        _sizes.setdefault(callback, Histogram(SIZE_BUCKETS)).observe(size)
+
+
+def count_error(callback):
+    with _lock:
+        _errors[callback] = _errors.get(callback, 0) + 1
+
+
+def observe_job(callback, seconds, failed):
+    queue_name = g.get('dash_job_queue') if has_request_context() else None
+    if queue_name is None:
+        observe_duration(callback, 'background', seconds)
+        if failed:
+            count_error(callback)
+    else:
+        open_job_queue(queue_name).append((callback, seconds, failed))
+
+
+def collect_jobs():
+    if job_queue_name is None:
+        return
+    queue = open_job_queue(job_queue_name())
+    while True:
+        try:
+            callback, seconds, failed = queue.popleft()
+        except IndexError:
+            break
+        observe_duration(callback, 'background', seconds)
+        if failed:
+            count_error(callback)
+
+
+def observe_transfer(route, raw, sent):
+    with _lock:
+        totals = _transfer.setdefault(route, [0, 0])
+        totals[0] += raw
+        totals[1] += sent
+
+
+def observe_startup(stage, seconds):
+    # Учитывается только первый замер этапа: повторные обращения к загруженному модулю бесплатны
+    with _lock:
+        if stage in _startup:
+            return
+        _startup[stage] = seconds
+    logger.info('Запуск: %s - %.3f с', stage, seconds)
+
+
+@contextlib.contextmanager
+def startup_stage(stage):
+    start = time.perf_counter()
+    yield
+    observe_startup(stage, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def timed(callback, phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_duration(callback, phase, time.perf_counter() - start)
+
+
+def instrument(name):
+    # Время расчета внутри callback; полное время и размер ответа снимаются в хуках Flask.
+    # Фоновый callback выполняется в отдельном процессе: контекст запроса копируется туда при fork,
+    # но ответ отдает другой процесс, поэтому учитываются только время расчета (phase="background") и ошибки
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                if has_request_context() and g.get('dash_request_pid') == os.getpid():
+                    if failed:
+                        count_error(name)
+                    g.dash_callback = name
+                    g.dash_callback_compute = seconds
+                else:
+                    observe_job(name, seconds, failed)
+        return wrapper
+    return decorator
+
+
+def render():
+    lines = [
+        '# HELP dash_callback_duration_seconds Callback wall time: total, compute (callback body), '
+        'serialize (the rest of the request, mostly response encoding) and background (body of a '
+        'background callback job; total, serialize and response bytes are not recorded for background callbacks).',
+        '# TYPE dash_callback_duration_seconds histogram',
+    ]
+    collect_jobs()
+    with _lock:
+        for (callback, phase), histogram in sorted(_durations.items()):
+            lines += histogram.render('dash_callback_duration_seconds', f'callback="{callback}",phase="{phase}"')
+        lines += ['# HELP dash_callback_response_bytes Size of the callback response body.',
+                  '# TYPE dash_callback_response_bytes histogram']
+        for callback, histogram in sorted(_sizes.items()):
+            lines += histogram.render('dash_callback_response_bytes', f'callback="{callback}"')
+        lines += ['# HELP dash_callback_errors_total Callbacks that raised an exception.',
+                  '# TYPE dash_callback_errors_total counter']
+        for callback, count in sorted(_errors.items()):
+            lines.append(f'dash_callback_errors_total{{callback="{callback}"}} {count}')
+        lines += ['# HELP dash_response_bytes_total Response bytes per route before (raw) and after (sent) compression.',
+                  '# TYPE dash_response_bytes_total counter']
+        for route, (raw, sent) in sorted(_transfer.items()):
+            lines.append(f'dash_response_bytes_total{{route="{route}",stage="raw"}} {raw}')
+            lines.append(f'dash_response_bytes_total{{route="{route}",stage="sent"}} {sent}')
+        lines += ['# HELP dash_startup_seconds Time spent in each startup stage: imports, data load, app setup.',
+                  '# TYPE dash_startup_seconds gauge']
+        for stage, seconds in _startup.items():
+            lines.append(f'dash_startup_seconds{{stage="{stage}"}} {seconds}')
+    stats = {name: figure_cache.stats() for name, figure_cache in sorted(cache.caches.items())}
+    lines += ['# HELP figure_cache_hits_total Figure cache hits in memory and in the warmed disk cache.',
+              '# TYPE figure_cache_hits_total counter']
+    for name, values in stats.items():
+        lines.append(f'figure_cache_hits_total{{cache="{name}",tier="memory"}} {values["hits"]}')
+        lines.append(f'figure_cache_hits_total{{cache="{name}",tier="disk"}} {values["disk_hits"]}')
+    lines += ['# HELP figure_cache_misses_total Figure cache lookups that had to render the value.',
+              '# TYPE figure_cache_misses_total counter']
+    for name, values in stats.items():
+        lines.append(f'figure_cache_misses_total{{cache="{name}"}} {values["misses"]}')
+    lines += ['# HELP figure_cache_entries Values held in memory and the cache capacity.',
+              '# TYPE figure_cache_entries gauge']
+    for name, values in stats.items():
+        lines.append(f'figure_cache_entries{{cache="{name}",kind="size"}} {values["size"]}')
+        lines.append(f'figure_cache_entries{{cache="{name}",kind="maxsize"}} {values["maxsize"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(server):
+    @server.before_request
+    def start_timer():
+        g.dash_request_start = time.perf_counter()
+        g.dash_request_pid = os.getpid()
+        if job_queue_name is not None:
+            g.dash_job_queue = job_queue_name()
+
+    @server.after_request
+    def record_callback(response):
+        callback = g.get('dash_callback')
+        if callback is None or not request.path.endswith('/_dash-update-component'):
+            return response
+        total = time.perf_counter() - g.dash_request_start
+        compute = g.get('dash_callback_compute', total)
+        observe_duration(callback, 'total', total)
+        observe_duration(callback, 'compute', compute)
+        observe_duration(callback, 'serialize', max(total - compute, 0))
+        observe_size(callback, response.calculate_content_length() or 0)
+        return response
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
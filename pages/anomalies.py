@@ -0,0 +1,127 @@
+from dash import dcc, html, Input, Output
+import numpy as np
+import plotly.graph_objects as go
+import dash_bootstrap_components as dbc
+from data import get_dataset
+from indicators import METRICS
+from metrics import instrument
+
+# Изменения за год определены начиная со второго года ряда
+years = list(range(1992, 2021))
+top_n = 15
+# Сколько стран из топа показывать на графике динамики
+trend_n = 5
+
+
+def get_layout():
+    continents = get_dataset().continent_rows.keys()
+    return html.Div([
+        html.H1("Аномалии и тренды уровня безработицы"),
+
+        dbc.Row([
+            dbc.Col([
+                dcc.Dropdown(
+                    id='anomaly-metric-dropdown',
+                    options=[{'label': label, 'value': metric} for metric, label in METRICS.items()],
+                    value='change_zscore',
+                    clearable=False
+                ),
+            ], width=4),
+            dbc.Col([
+                dcc.Dropdown(
+                    id='anomaly-year-dropdown',
+                    options=[{'label': str(year), 'value': year} for year in years],
+                    value=2020,
+                    clearable=False
+                ),
+            ], width=2),
+            dbc.Col([
+                dcc.Dropdown(
+                    id='anomaly-continent-dropdown',
+                    options=[{'label': continent, 'value': continent} for continent in continents],
+                    placeholder='Все континенты',
+                    clearable=True
+                ),
+            ], width=3),
+            dbc.Col([
+                dcc.RadioItems(
+                    id='anomaly-order',
+                    options=[
+                        {'label': 'Наибольшие', 'value': 'desc'},
+                        {'label': 'Наименьшие', 'value': 'asc'}
+                    ],
+                    value='desc',
+                    labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+                ),
+            ], width=3),
+        ], style={'margin-bottom': '20px'}),
+
+        dcc.Graph(id='anomaly-bar-chart'),
+        dcc.Graph(id='anomaly-trend-chart'),
+        html.Div(id='anomaly-table'),
+    ])
+
+
+def register_callbacks(app):
+    @app.callback(
+        Output('anomaly-bar-chart', 'figure'),
+        Output('anomaly-trend-chart', 'figure'),
+        Output('anomaly-table', 'children'),
+        Input('anomaly-metric-dropdown', 'value'),
+        Input('anomaly-year-dropdown', 'value'),
+        Input('anomaly-continent-dropdown', 'value'),
+        Input('anomaly-order', 'value')
+    )
+    @instrument('update_anomalies')
+    def update_anomalies(metric, selected_year, continent, order):
+        dataset = get_dataset()
+        rows = dataset.indicators.top_rows(metric, selected_year, top_n, continent, ascending=order == 'asc')
+        return (build_anomaly_bar_chart(dataset, metric, selected_year, rows),
+                build_trend_chart(dataset, metric, rows[:trend_n]),
+                build_anomaly_table(dataset, selected_year, rows))
+
+
+def build_anomaly_bar_chart(dataset, metric, selected_year, rows):
+    # Первая страна топа наверху графика
+    rows = rows[::-1]
+    fig = go.Figure(data=go.Bar(
+        x=dataset.indicators.values(metric, selected_year, rows).round(2),
+        y=dataset.countries['Country Name'].to_numpy()[rows],
+        customdata=dataset.countries['Continent'].to_numpy()[rows],
+        orientation='h',
+        hovertemplate='<b>%{y}</b><br>%{customdata}<br>%{x}<extra></extra>',
+    ))
+    fig.update_layout(title=f'{METRICS[metric]} в {selected_year}', xaxis_title=METRICS[metric],
+                      yaxis_title='Страна', height=max(400, 30 * len(rows)))
+    return fig
+
+
+def build_trend_chart(dataset, metric, rows):
+    # Ряды берутся прямо из матрицы показателя за все годы
+    values = dataset.indicators[metric][rows].round(2)
+    all_years = [int(year) for year in dataset.years]
+    fig = go.Figure()
+    for country, series in zip(dataset.countries['Country Name'].to_numpy()[rows], values):
+        fig.add_trace(go.Scatter(x=all_years, y=series, mode='lines+markers', name=country,
+                                 hovertemplate='Год: %{x}<br>%{y}'))
+    fig.update_layout(title=f'{METRICS[metric]}: динамика для первых {len(rows)} стран',
+                      xaxis_title='Год', yaxis_title=METRICS[metric], legend_title='Страна')
+    return fig
+
+
+def build_anomaly_table(dataset, selected_year, rows):
+    columns = {metric: dataset.indicators.values(metric, selected_year, rows).round(2) for metric in METRICS}
+    return html.Table([
+        html.Thead([
+            html.Tr([html.Th('Страна', style={'text-align': 'center'}),
+                     html.Th('Континент', style={'text-align': 'center'})]
+                    + [html.Th(label, style={'text-align': 'center'}) for label in METRICS.values()])
+        ]),
+        html.Tbody([
+            html.Tr([html.Td(dataset.countries['Country Name'][row], style={'text-align': 'center'}),
+                     html.Td(dataset.countries['Continent'][row], style={'text-align': 'center'})]
+                    + [html.Td('' if np.isnan(values[i]) else float(values[i]), style={'text-align': 'center'})
+                       for values in columns.values()])
+            for i, row in enumerate(rows)
+        ])
+    ], className='table')
@@ -1,39 +1,101 @@
 from dash import dcc, html, Input, Output
-import pandas as pd
 import plotly.express as px
 import dash_bootstrap_components as dbc
+import data
+from data import get_dataset
+from metrics import instrument
+from cache import cache_from_env
 
-df = pd.read_csv('unemployment_analysis.csv', sep=',')
-population = pd.read_csv("World_Population_2020.csv", sep=',')
+years = list(range(1992, 2021))
 
-continents = {}
-for index, row in df.iterrows():
-    country_name = row['Country Name']
-    continent = row['Continent']
-    if continent in continents:
-        continents[continent].append(country_name)
-    else:
-        continents[continent] = [country_name]
+bar_cache = cache_from_env('BAR', maxsize=512, sources=(__file__, data.__file__))
 
 
-def get_top_countries_global(year):
-    merged_df = df[['Country Name', 'Numeric code', str(year)]].merge(population[['Numeric code', str(year)]],
-                                                                      how='left', on='Numeric code',
-                                                                      suffixes=('', '_population'))
+def get_top_countries_global(dataset, year, n=10, offset=0):
+    merged_df = dataset.frame([year], dataset.top_rows(year, n, offset), with_population=True)
+    return merged_df[['Country Name', 'Numeric code', str(year), f'{year}_population']]
 
-    merged_df = merged_df.sort_values(by=str(year), ascending=False).head(10)
-    return merged_df
 
+def get_continent_slice(dataset, continent, year):
+    df_filtered = dataset.frame([year, year - 1], dataset.continent_rows[continent])
+    return df_filtered[['Country Name', str(year), str(year - 1)]]
 
-def get_top_countries_continent(continent, year):
-    continent_countries = continents[continent]
-    df_filtered = df[df['Country Name'].isin(continent_countries)]
-    df_filtered = df_filtered[['Country Name', str(year)]]
-    df_filtered = df_filtered.sort_values(by=str(year), ascending=False).head(10)
-    return df_filtered
+
+def get_top_countries_continent(dataset, continent, year, n=10, offset=0):
+    df_filtered = dataset.frame([year], dataset.top_rows(year, n, offset, continent))
+    return df_filtered[['Country Name', str(year)]]
+
+
+def build_top_countries_global_table(top_countries_df, selected_year):
+    return [
+        html.Table([
+            html.Thead([
+                html.Tr([
+                    html.Th('Страна', style={'text-align': 'center'}),
+                    html.Th('Население', style={'text-align': 'center'}),
+                    html.Th('Уровень безработицы', style={'text-align': 'center'}),
+                ])
+            ]),
+            html.Tbody([
+                html.Tr([
+                    html.Td(country, style={'text-align': 'center'}),
+                    html.Td(f"{population / 10e2:.{1}f} млн.", style={'text-align': 'center'}),
+                    html.Td(f'{rate}%', style={'text-align': 'center'})
+                ]) for country, population, rate in zip(top_countries_df['Country Name'],
+                                                        top_countries_df[f'{selected_year}_population'],
+                                                        top_countries_df[str(selected_year)])
+            ])
+        ], className='table')
+    ]
+
+
+def build_top_countries_continent_table(top_countries_df, selected_year):
+    return [
+        html.Table([
+            html.Thead([
+                html.Tr([
+                    html.Th('Страна', style={'text-align': 'center'}),
+                    html.Th('Уровень безработицы', style={'text-align': 'center'}),
+                ])
+            ]),
+            html.Tbody([
+                html.Tr([
+                    html.Td(country, style={'text-align': 'center'}),
+                    html.Td(f'{rate}%', style={'text-align': 'center'})
+                ]) for country, rate in zip(top_countries_df['Country Name'], top_countries_df[str(selected_year)])
+            ])
+        ], className='table')
+    ]
+
+
+def build_deviation_bar_chart(dataset, selected_continent, selected_year, df_filtered):
+    df_filtered = df_filtered[['Country Name', str(selected_year)]].copy()
+    continent_avg = dataset.continent_stat('Mean_Rate', selected_continent, selected_year)
+    df_filtered['Deviation'] = round(df_filtered[str(selected_year)] - continent_avg, 2)
+
+    fig = px.bar(df_filtered.sort_values(by='Deviation', ascending=True), x='Country Name', y='Deviation',
+                 title=f'Отклонение от среднего уровня безработицы в {selected_year}')
+    fig.update_layout(xaxis_title='Страна', yaxis_title='Отклонение')
+    fig.update_traces(hovertemplate='<b>%{x}</b><br>Отклонение: %{y}%')
+    return fig
+
+
+def build_change_deviation_bar_chart(dataset, selected_continent, selected_year, df_filtered):
+    df_filtered = df_filtered[['Country Name', str(selected_year), str(selected_year - 1)]].copy()
+    df_filtered['Change'] = df_filtered[str(selected_year)] - df_filtered[str(selected_year - 1)]
+    continent_avg_change = dataset.continent_stat('Mean_Change', selected_continent, selected_year)
+    df_filtered['Change Deviation'] = round(df_filtered['Change'] - continent_avg_change, 2)
+
+    fig = px.bar(df_filtered.sort_values(by='Change Deviation', ascending=True), x='Country Name',
+                 y='Change Deviation',
+                 title=f'Отклонение от среднего изменения уровня безработицы в {selected_year}')
+    fig.update_layout(xaxis_title='Страна', yaxis_title='Отклонение изменения')
+    fig.update_traces(hovertemplate='<b>%{x}</b><br>Отклонение изменения: %{y}%')
+    return fig
 
 
 def get_layout():
+    continents = get_dataset().continent_rows.keys()
     return html.Div([
         html.H1("Анализ уровня безработицы в странах по континентам"),
 
@@ -41,7 +103,7 @@ def get_layout():
             dbc.Col([
                 dcc.Dropdown(
                     id='continent-dropdown',
-                    options=[{'label': continent, 'value': continent} for continent in continents.keys()],
+                    options=[{'label': continent, 'value': continent} for continent in continents],
                     value='Asia',
                     placeholder='Выберите континент',
                     clearable=False,
@@ -52,7 +114,7 @@ def get_layout():
             dbc.Col([
                 dcc.Dropdown(
                     id='year-dropdown',
-                    options=[{'label': str(year), 'value': year} for year in range(1992, 2021)],
+                    options=[{'label': str(year), 'value': year} for year in years],
                     value=2020,
                     placeholder='Выберите год',
                     clearable=False,
@@ -85,90 +147,50 @@ def register_callbacks(app):
         Output('top-countries-global-table', 'children'),
         Input('year-dropdown', 'value')
     )
+    @instrument('update_top_countries_global_table')
     def update_top_countries_global_table(selected_year):
         if not selected_year:
             return []
+        return cached_render(('global', selected_year))
 
-        top_countries_df = get_top_countries_global(selected_year)
-        table_rows = [
-            html.Table([
-                html.Thead([
-                    html.Tr([
-                        html.Th('Страна', style={'text-align': 'center'}),
-                        html.Th('Население', style={'text-align': 'center'}),
-                        html.Th('Уровень безработицы', style={'text-align': 'center'}),
-                    ])
-                ]),
-                html.Tbody([
-                    html.Tr([
-                        html.Td(row['Country Name'], style={'text-align': 'center'}),
-                        html.Td(f"{row[str(selected_year) + '_population'] / 10e2:.{1}f} млн.", style={'text-align': 'center'}),
-                        html.Td(f'{row[str(selected_year)]}%', style={'text-align': 'center'})
-                    ]) for index, row in top_countries_df.iterrows()
-                ])
-            ], className='table')
-        ]
-        return table_rows
-
+    # Таблица и оба графика зависят от одной пары (континент, год),
+    # поэтому считаются одним запросом по общей выборке стран континента
     @app.callback(
         Output('top-countries-continent-table', 'children'),
-        Input('continent-dropdown', 'value'),
-        Input('year-dropdown', 'value')
-    )
-    def update_top_countries_continent_table(selected_continent, selected_year):
-        top_countries_df = get_top_countries_continent(selected_continent, selected_year)
-        table_rows = [
-            html.Table([
-                html.Thead([
-                    html.Tr([
-                        html.Th('Страна', style={'text-align': 'center'}),
-                        html.Th('Уровень безработицы', style={'text-align': 'center'}),
-                    ])
-                ]),
-                html.Tbody([
-                    html.Tr([
-                        html.Td(row['Country Name'], style={'text-align': 'center'}),
-                        html.Td(f'{row[str(selected_year)]}%', style={'text-align': 'center'})
-                    ]) for index, row in top_countries_df.iterrows()
-                ])
-            ], className='table')
-        ]
-        return table_rows
-
-    @app.callback(
         Output('deviation-bar-chart', 'figure'),
-        Input('continent-dropdown', 'value'),
-        Input('year-dropdown', 'value')
-    )
-    def update_deviation_bar_chart(selected_continent, selected_year):
-        continent_countries = continents[selected_continent]
-        df_filtered = df[df['Country Name'].isin(continent_countries)]
-        df_filtered = df_filtered[['Country Name', str(selected_year)]]
-        continent_avg = df_filtered[str(selected_year)].mean()
-        df_filtered['Deviation'] = round(df_filtered[str(selected_year)] - continent_avg, 2)
-
-        fig = px.bar(df_filtered.sort_values(by='Deviation', ascending=True), x='Country Name', y='Deviation',
-                     title=f'Отклонение от среднего уровня безработицы в {selected_year}')
-        fig.update_layout(xaxis_title='Страна', yaxis_title='Отклонение')
-        fig.update_traces(hovertemplate='<b>%{x}</b><br>Отклонение: %{y}%')
-        return fig
-
-    @app.callback(
         Output('change-deviation-bar-chart', 'figure'),
         Input('continent-dropdown', 'value'),
         Input('year-dropdown', 'value')
     )
-    def update_change_deviation_bar_chart(selected_continent, selected_year):
-        continent_countries = continents[selected_continent]
-        df_filtered = df[df['Country Name'].isin(continent_countries)]
-        df_filtered = df_filtered[['Country Name', str(selected_year), str(selected_year - 1)]]
-        df_filtered['Change'] = df_filtered[str(selected_year)] - df_filtered[str(selected_year - 1)]
-        continent_avg_change = df_filtered['Change'].mean()
-        df_filtered['Change Deviation'] = round(df_filtered['Change'] - continent_avg_change, 2)
-
-        fig = px.bar(df_filtered.sort_values(by='Change Deviation', ascending=True), x='Country Name',
-                     y='Change Deviation',
-                     title=f'Отклонение от среднего изменения уровня безработицы в {selected_year}')
-        fig.update_layout(xaxis_title='Страна', yaxis_title='Отклонение изменения')
-        fig.update_traces(hovertemplate='<b>%{x}</b><br>Отклонение изменения: %{y}%')
-        return fig
+    @instrument('update_continent_charts')
+    def update_continent_charts(selected_continent, selected_year):
+        return tuple(cached_render(('continent', selected_continent, selected_year)))
+
+
+def cached_render(key):
+    dataset = get_dataset()
+    value = bar_cache.get(key, dataset.version)
+    if value is None:
+        value = render_state(dataset, key)
+        bar_cache.set(key, dataset.version, value)
+    return value
+
+
+def cached_states(dataset):
+    keys = [('global', year) for year in years]
+    keys += [('continent', continent, year) for continent in dataset.continent_rows for year in years]
+    return keys
+
+
+def render_state(dataset, key):
+    # Готовые таблицы и фигуры хранятся в кэше, callback'и отдают их без пересборки
+    if key[0] == 'global':
+        selected_year = key[1]
+        top_countries_df = get_top_countries_global(dataset, selected_year)
+        return build_top_countries_global_table(top_countries_df, selected_year)
+    selected_continent, selected_year = key[1:]
+    df_filtered = get_continent_slice(dataset, selected_continent, selected_year)
+    top_countries_df = get_top_countries_continent(dataset, selected_continent, selected_year)
+    return [build_top_countries_continent_table(top_countries_df, selected_year),
+                           build_deviation_bar_chart(dataset, selected_continent, selected_year, df_filtered),
+            build_change_deviation_bar_chart(dataset, selected_continent, selected_year, df_filtered)]
@@ -1,37 +1,61 @@
-from dash import dcc, html, Input, Output, State, ALL, callback_context
-import pandas as pd
+import bisect
+import warnings
+from dash import dcc, html, Input, Output, State, ALL, callback_context, ClientsideFunction, Patch, no_update
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
+import background
+from data import get_dataset
+from downsample import lttb
+from metrics import instrument
+
+default_countries = ['Russian Federation', 'Poland']
+# Сколько вариантов показывать в выпадающем списке при поиске страны
+search_limit = 20
+# В режиме сравнения всех стран ряды прореживаются, только если точек больше overview_point_budget
+# (все страны за все годы - около 5600 точек, WebGL рисует их без задержек), а если стран больше
+# overview_max_series, рисуется равномерная по уровню безработицы выборка
+overview_point_budget = 50000
+overview_min_points = 8
+overview_max_series = 500
+overview_colors = px.colors.qualitative.Plotly
+
+
+def render_country_chips(countries):
+    return [
+        html.Div([
+            html.Span(country, style={'margin-right': '10px'}),
+            dbc.Button('Удалить', id={'type': 'remove-country-button', 'index': country}, color='danger', size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
+        ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px', 'margin-bottom': '5px'})
+        for country in countries
+    ]
 
-df = pd.read_csv("unemployment_analysis.csv", sep=',')
 
 def get_layout():
     return html.Div([
         html.H1("Анализ уровня безработицы по странам"),
         
         html.Div([
+            # Варианты подбираются на сервере по мере ввода, список всех стран в макет не попадает
             dcc.Dropdown(
                 id='country-dropdown',
-                options=[{'label': country, 'value': country} for country in df['Country Name'].unique()],
+                options=[],
                 value=None,
-                placeholder='Выберите страну',
+                placeholder='Начните вводить название страны',
                 clearable=False,
+                search_order='original',
                 style={'flex': '1'}
             ),
             dbc.Button('Добавить страну', id='add-country-button', color='primary', n_clicks=0, style={'margin-left': '10px'}),
         ], style={'display': 'flex', 'align-items': 'center', 'margin-bottom': '20px'}),
         
-        html.Div(id='selected-countries', children=[
-            html.Div([
-                html.Span('Russian Federation', style={'margin-right': '10px'}),
-                dbc.Button('Удалить', id={'type': 'remove-country-button', 'index': 'Russian Federation'}, color='danger', size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
-            ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px', 'margin-bottom': '5px'}),
-            html.Div([
-                html.Span('Poland', style={'margin-right': '10px'}),
-                dbc.Button('Удалить', id={'type': 'remove-country-button', 'index': 'Poland'}, color='danger', size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
-            ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px', 'margin-bottom': '5px'})
-        ], style={'display': 'flex', 'flex-wrap': 'wrap', 'margin-bottom': '20px'}),
+        dbc.Switch(id='compare-all-switch', label='Сравнить все страны', value=False,
+                   style={'margin-bottom': '10px'}),
+
+        html.Div(id='selected-countries', children=render_country_chips(default_countries),
+                 style={'display': 'flex', 'flex-wrap': 'wrap', 'margin-bottom': '20px'}),
+        dcc.Store(id='selected-countries-store', data=default_countries),
 
         dcc.RangeSlider(
             id='year-range-slider',
@@ -40,8 +64,10 @@ def get_layout():
             value=[1991, 2020],
             marks={str(year): str(year) for year in range(1991, 2021)},
             step=1,
+            updatemode='mouseup',
             tooltip={"placement": "bottom", "always_visible": True}
         ),
+        dcc.Store(id='year-range-store', data=[1991, 2020]),
 
         html.Div([
             dcc.Graph(id='line-chart'),
@@ -54,99 +80,280 @@ def get_layout():
         html.Div([
             dcc.Graph(id='bar-chart', style={'flex': '1'}),
         ], style={'margin-bottom': '20px'}),
+
+        dcc.Store(id='rendered-countries'),
     ])
 
 
 def register_callbacks(app):
     @app.callback(
-        Output('selected-countries', 'children'),
+        Output('country-dropdown', 'options'),
+        Input('country-dropdown', 'search_value'),
+        State('country-dropdown', 'value')
+    )
+    @instrument('search_countries')
+    def search_countries(search_value, selected_country):
+        # Пустая строка поиска оставляет прежние варианты, чтобы не сбрасывать выбранную страну
+        if not search_value:
+            return no_update
+        countries = get_dataset().country_search.search(search_value, limit=search_limit)
+        if selected_country and selected_country not in countries:
+            countries.append(selected_country)
+        # Браузер сам фильтрует варианты по строке поиска: поле search с этой строкой оставляет
+        # все найденные сервером названия, включая похожие, в порядке ранжирования сервера
+        return [{'label': country, 'value': country, 'search': search_value} for country in countries]
+
+    @app.callback(
+        Output('selected-countries-store', 'data'),
         Output('country-dropdown', 'value'),
         Input('add-country-button', 'n_clicks'),
         Input({'type': 'remove-country-button', 'index': ALL}, 'n_clicks'),
         State('country-dropdown', 'value'),
-        State('selected-countries', 'children')
+        State('selected-countries-store', 'data')
     )
+    @instrument('manage_countries')
     def manage_countries(add_clicks, remove_clicks, selected_country, selected_countries):
         ctx = callback_context
-        if not ctx.triggered:
-            return selected_countries, selected_country
-
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-
-        if 'add-country-button' in button_id and selected_country:
-            if selected_country not in [item['props']['children'][0]['props']['children'] for item in selected_countries]:
-                selected_countries.append(
-                    html.Div([
-                        html.Span(selected_country, style={'margin-right': '10px'}),
-                        dbc.Button('Удалить', id={'type': 'remove-country-button', 'index': selected_country}, color='danger', size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
-                    ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px', 'margin-bottom': '5px'})
-                )
-            selected_country = None
-        else:
-            button_index = eval(button_id)['index']
-            selected_countries = [country for country in selected_countries if country['props']['children'][0]['props']['children'] != button_index]
-        
-        return selected_countries, selected_country
+        # Кнопки удаления стран создаются с n_clicks=0, их отрисовка тоже запускает callback
+        if not ctx.triggered or not ctx.triggered[0]['value']:
+            return no_update, no_update
+
+        if ctx.triggered_id == 'add-country-button':
+            if not selected_country:
+                return no_update, no_update
+            if selected_country in selected_countries:
+                return no_update, None
+            return selected_countries + [selected_country], None
+        return [country for country in selected_countries if country != ctx.triggered_id['index']], no_update
+
+    @app.callback(
+        Output('selected-countries', 'children'),
+        Input('selected-countries-store', 'data'),
+        prevent_initial_call=True
+    )
+    @instrument('render_selected_countries')
+    def render_selected_countries(selected_countries):
+        return render_country_chips(selected_countries)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='charts', function_name='debounce_range'),
+        Output('year-range-store', 'data'),
+        Input('year-range-slider', 'value'),
+        prevent_initial_call=True
+    )
 
     @app.callback(
         Output('line-chart', 'figure'),
         Output('heatmap', 'figure'),
         Output('bar-chart', 'figure'),
-        Input('selected-countries', 'children'),
-        Input('year-range-slider', 'value')
+        Output('rendered-countries', 'data'),
+        Input('selected-countries-store', 'data'),
+        Input('year-range-store', 'data'),
+        Input('compare-all-switch', 'value'),
+        State('rendered-countries', 'data'),
+        **background.callback_options(cancel=[Input('url', 'pathname')])
     )
-    def update_charts(selected_countries, year_range):
-        countries = [item['props']['children'][0]['props']['children'] for item in selected_countries]
+    @instrument('update_charts')
+    def update_charts(selected_countries, year_range, compare_all, rendered_countries):
+        dataset = get_dataset()
+        if compare_all:
+            # Выбор стран на графики всех стран не влияет
+            if callback_context.triggered_id == 'selected-countries-store':
+                return no_update, no_update, no_update, no_update
+            return build_overview_charts(dataset, year_range) + ([],)
+
+        countries = [dataset.countries['Country Name'][row] for row in dataset.rows_for(selected_countries)]
         if not countries:
-            return {}, {}, {}
-        
-        df_filtered = df[df['Country Name'].isin(countries)]
-        df_long = pd.melt(df_filtered, id_vars=['Country Name'], value_vars=[str(year) for year in range(1991, 2022)], var_name='Year', value_name='Unemployment Rate')
-        df_long['Year'] = df_long['Year'].astype(int)
-        df_long = df_long[(df_long['Year'] >= year_range[0]) & (df_long['Year'] <= year_range[1])]
-        
-        line_fig = px.line(df_long, x='Year', y='Unemployment Rate', color='Country Name', title='Динамика уровня безработицы по странам')
-        line_fig.update_traces(mode='lines+markers', hovertemplate='Год: %{x}<br>Безработица: %{y}%')
-        line_fig.update_layout(
-            xaxis_title='Год', 
-            yaxis_title='Уровень безработицы',
-            legend_title='Страна'
-        )
-
-        heatmap_data = df_long.pivot(index='Country Name', columns='Year', values='Unemployment Rate')
-        heatmap_fig = go.Figure(data=go.Heatmap(
-            z=heatmap_data.values,
-            x=heatmap_data.columns,
-            y=heatmap_data.index,
-            colorscale='Plasma_r'
-        ))
-        heatmap_fig.update_layout(
-            title='Тепловая карта уровня безработицы по годам', 
-            xaxis_title='Год', 
-            yaxis_title='Страна',
-            legend_title='Страна'
-        )
-
-        df_long['Previous Year Unemployment Rate'] = df_long.groupby('Country Name')['Unemployment Rate'].shift(1)
-        df_long['Change'] = df_long['Unemployment Rate'] - df_long['Previous Year Unemployment Rate']
-        
-        bar_fig = go.Figure()
-        for country in df_long['Country Name'].unique():
-            country_data = df_long[df_long['Country Name'] == country]
-            bar_fig.add_trace(go.Bar(
-                x=country_data['Year'],
-                y=country_data['Change'],
-                name=country,
-                text=country_data['Country Name'],
-                hovertemplate='Год: %{x}<br>Страна: %{text}<br>Изменение уровня безработицы: %{y}%',
-            ))
-
-        bar_fig.update_layout(
-            title='Изменение уровня безработицы по годам',
-            xaxis_title='Год',
-            yaxis_title='Изменение уровня безработицы',
-            legend_title='Страна',
-            barmode='group'
-        )
-        
-        return line_fig, heatmap_fig, bar_fig
+            return {}, {}, {}, []
+
+        # Полная перестройка нужна только при смене диапазона лет,
+        # добавление и удаление стран отправляется частичными обновлениями
+        if callback_context.triggered_id == 'selected-countries-store' and rendered_countries:
+            return patch_charts(dataset, rendered_countries, countries, year_range) + (countries,)
+        return build_charts(dataset, countries, year_range) + (countries,)
+
+
+def country_series(dataset, country, year_range):
+    years = list(range(year_range[0], year_range[1] + 1))
+    first, last = dataset.year_index[str(year_range[0])], dataset.year_index[str(year_range[1])]
+    rates = dataset.rates[dataset.country_index[country], first:last + 1].astype(np.float64).round(2)
+    changes = np.full(len(years), np.nan)
+    changes[1:] = rates[1:] - rates[:-1]
+    return years, rates, changes
+
+
+def line_trace(country, years, rates):
+    return go.Scatter(x=years, y=rates, mode='lines+markers', name=country,
+                      hovertemplate='Год: %{x}<br>Безработица: %{y}%')
+
+
+def bar_trace(country, years, changes):
+    return go.Bar(
+        x=years,
+        y=changes,
+        name=country,
+        hovertemplate='Год: %{x}<br>Страна: %{fullData.name}<br>Изменение уровня безработицы: %{y}%',
+    )
+
+
+def heatmap_row(rates):
+    # Строки тепловой карты хранятся списками, чтобы их можно было вставлять через Patch
+    return [None if np.isnan(rate) else rate for rate in rates.tolist()]
+
+
+def build_charts(dataset, countries, year_range):
+    line_fig = go.Figure()
+    bar_fig = go.Figure()
+    heatmap_rows = {}
+    for country in countries:
+        years, rates, changes = country_series(dataset, country, year_range)
+        line_fig.add_trace(line_trace(country, years, rates))
+        bar_fig.add_trace(bar_trace(country, years, changes))
+        heatmap_rows[country] = heatmap_row(rates)
+
+    line_fig.update_layout(
+        title='Динамика уровня безработицы по странам',
+        xaxis_title='Год',
+        yaxis_title='Уровень безработицы',
+        legend_title='Страна'
+    )
+
+    heatmap_countries = sorted(heatmap_rows)
+    heatmap_fig = go.Figure(data=go.Heatmap(
+        z=[heatmap_rows[country] for country in heatmap_countries],
+        x=list(range(year_range[0], year_range[1] + 1)),
+        y=heatmap_countries,
+        colorscale='Plasma_r'
+    ))
+    heatmap_fig.update_layout(
+        title='Тепловая карта уровня безработицы по годам',
+        xaxis_title='Год',
+        yaxis_title='Страна',
+        legend_title='Страна'
+    )
+
+    bar_fig.update_layout(
+        title='Изменение уровня безработицы по годам',
+        xaxis_title='Год',
+        yaxis_title='Изменение уровня безработицы',
+        legend_title='Страна',
+        barmode='group'
+    )
+
+    return line_fig, heatmap_fig, bar_fig
+
+
+def patch_charts(dataset, rendered_countries, countries, year_range):
+    line_patch, heatmap_patch, bar_patch = Patch(), Patch(), Patch()
+
+    # Графики упорядочены как строки датасета, тепловая карта - по алфавиту
+    current = [country for country in rendered_countries if country in dataset.country_index]
+    heatmap_current = sorted(current)
+    for country in reversed([country for country in current if country not in countries]):
+        position = current.index(country)
+        del line_patch['data'][position]
+        del bar_patch['data'][position]
+        current.pop(position)
+
+        position = heatmap_current.index(country)
+        del heatmap_patch['data'][0]['z'][position]
+        del heatmap_patch['data'][0]['y'][position]
+        heatmap_current.pop(position)
+
+    for country in countries:
+        if country in current:
+            continue
+        years, rates, changes = country_series(dataset, country, year_range)
+        position = bisect.bisect([dataset.country_index[name] for name in current], dataset.country_index[country])
+        line_patch['data'].insert(position, line_trace(country, years, rates).to_plotly_json())
+        bar_patch['data'].insert(position, bar_trace(country, years, changes).to_plotly_json())
+        current.insert(position, country)
+
+        position = bisect.bisect(heatmap_current, country)
+        heatmap_patch['data'][0]['z'].insert(position, heatmap_row(rates))
+        heatmap_patch['data'][0]['y'].insert(position, country)
+        heatmap_current.insert(position, country)
+
+    return line_patch, heatmap_patch, bar_patch
+
+
+def overview_rows(rates):
+    # Строки для графиков всех стран: все, если укладываются в лимит, иначе равномерно по среднему уровню
+    if len(rates) <= overview_max_series:
+        return np.arange(len(rates))
+    with np.errstate(invalid='ignore'):
+        means = np.nansum(rates, axis=1) / (~np.isnan(rates)).sum(axis=1)
+    order = np.argsort(means, kind='stable')
+    return np.sort(order[np.linspace(0, len(order) - 1, overview_max_series).round().astype(np.intp)])
+
+
+def build_overview_charts(dataset, year_range):
+    first, last = dataset.year_index[str(year_range[0])], dataset.year_index[str(year_range[1])]
+    years = np.arange(year_range[0], year_range[1] + 1)
+    rates = dataset.rates[:, first:last + 1]
+    rows = overview_rows(rates)
+    names = dataset.countries['Country Name'].to_numpy()
+    title_suffix = '' if len(rows) == len(rates) else f' (показано {len(rows)} из {len(rates)})'
+
+    # Значения передаются в float32, до сотых они округляются в подсказках
+    line_rates = rates[rows]
+    if line_rates.size > overview_point_budget:
+        line_years, line_rates = lttb(years, line_rates, max(overview_min_points, overview_point_budget // len(rows)))
+    else:
+        line_years = np.broadcast_to(years, line_rates.shape)
+    line_fig = go.Figure(layout=dict(
+        title='Динамика уровня безработицы во всех странах' + title_suffix,
+        xaxis_title='Год',
+        yaxis_title='Уровень безработицы',
+        legend_title='Континент'
+    )).to_plotly_json()
+    # Сотни трасс собираются словарями без проверки go.Scattergl, общие свойства задаются один раз в шаблоне
+    line_fig['layout']['template']['data']['scattergl'] = [{
+        'mode': 'lines', 'showlegend': False, 'line': {'width': 1},
+        'hovertemplate': 'Год: %{x}<br>Безработица: %{y:.2f}%',
+    }]
+    # Страны сгруппированы по континентам: в легенде только континенты, щелчок скрывает всю группу
+    colors = [overview_colors[code % len(overview_colors)] for code in range(len(dataset.continents))]
+    line_fig['data'] = [{'type': 'scattergl', 'x': [], 'y': [], 'name': continent, 'legendgroup': continent,
+                         'showlegend': True, 'line': {'color': color}}
+                        for continent, color in zip(dataset.continents, colors)]
+    for row, x, y in zip(rows, line_years, line_rates.astype(np.float32)):
+        code = dataset.continent_codes[row]
+        line_fig['data'].append({'type': 'scattergl', 'x': x, 'y': y, 'name': names[row],
+                                 'legendgroup': dataset.continents[code], 'line': {'color': colors[code]}})
+
+    # Тепловая карта строится прямо из матрицы страна × год, строки по алфавиту
+    heatmap_rows = rows[np.argsort(names[rows], kind='stable')]
+    heatmap_fig = go.Figure(data=go.Heatmap(
+        z=rates[heatmap_rows].astype(np.float32),
+        x=years,
+        y=names[heatmap_rows],
+        colorscale='Plasma_r',
+        hovertemplate='Год: %{x}<br>Страна: %{y}<br>Безработица: %{z:.2f}%<extra></extra>'
+    ))
+    heatmap_fig.update_layout(
+        title='Тепловая карта уровня безработицы по годам' + title_suffix,
+        xaxis_title='Год',
+        yaxis_title='Страна',
+        height=max(450, 12 * len(heatmap_rows))
+    )
+
+    # Вместо столбца на каждую страну - медиана изменения по всем странам
+    changes = np.diff(rates.astype(np.float64).round(2), axis=1)
+    with warnings.catch_warnings():
+        # Год без данных ни по одной стране дает пропуск
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median_changes = np.nanmedian(changes, axis=0).round(2)
+    bar_fig = go.Figure(data=go.Bar(
+        x=years[1:],
+        y=median_changes,
+        name='Медиана',
+        hovertemplate='Год: %{x}<br>Медиана изменения уровня безработицы: %{y}%',
+    ))
+    bar_fig.update_layout(
+        title='Медианное изменение уровня безработицы по годам во всех странах',
+        xaxis_title='Год',
+        yaxis_title='Изменение уровня безработицы'
+    )
+
+    return line_fig, heatmap_fig, bar_fig
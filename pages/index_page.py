@@ -1,4 +1,4 @@
-import dash_html_components as html
+from dash import html
 import dash_bootstrap_components as dbc
 
 index_page = html.Div([
@@ -11,6 +11,7 @@ index_page = html.Div([
         html.Li("Изменение уровня безработицы по годам: Представляет собой столбчатую диаграмму, показывающую изменения уровня безработицы в различных странах по годам. Это полезно для анализа ежегодных изменений и оценки эффективности экономических политик."),
         html.Li("Топ 10 стран по безработице: Сортирует страны по уровню безработицы и отображает десять стран с самым высоким уровнем за выбранный год. Это помогает выявить наиболее пострадавшие от безработицы страны."),
         html.Li("Столбчатые диаграммы по отклонению уровня безработицы: Эти диаграммы показывают отклонение уровня безработицы в странах и изменения уровня безработицы по годам. Это позволяет более детально анализировать изменения и выявлять тренды."),
+        html.Li("Аномалии и тренды: Показывает страны с самыми резкими изменениями уровня безработицы за выбранный год, в том числе относительно истории самой страны и среднего по континенту, и динамику этих показателей."),
     ]),
     html.P("Датасет содержит данные об уровне безработицы по странам мира с 1991 по 2020 годы. Каждый год представлен отдельной колонкой, где указаны значения уровня безработицы для каждой страны. Данные позволяют проводить глубокий анализ и выявлять как долгосрочные, так и краткосрочные тренды в уровне безработицы."),
     html.P("Дашборд разработали:"),
@@ -1,11 +1,13 @@
-from dash import dcc, html, Input, Output, State, ALL, callback_context
-import pandas as pd
+import base64
+import numpy as np
+from dash import dcc, html, Input, Output, State, ALL, callback_context, ClientsideFunction, no_update
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
-
-df = pd.read_csv("unemployment_analysis.csv", sep=',')
-
-population = pd.read_csv("World_Population_2020.csv", sep=',')
+import data
+from data import get_dataset
+from metrics import instrument
+from cache import cache_from_env
+from geo_assets import topojson_url
 
 continents_coordinates = {
     "Asia": [42.283914, 78.224456],
@@ -18,10 +20,12 @@ continents_coordinates = {
 }
 
 years = [str(year) for year in range(1991, 2021)]
-continents = df['Continent'].unique()
+
+map_cache = cache_from_env('MAP', maxsize=256, sources=(__file__, data.__file__))
 
 
 def get_layout():
+    continents = get_dataset().continent_rows.keys()
     return html.Div([
         html.H1("Карта мира по показателям безработицы"),
         dcc.RadioItems(
@@ -41,7 +45,8 @@ def get_layout():
                 clearable=True
             ),
             dbc.Button('Добавить континент', id='add-button', color='primary', n_clicks=0),
-            html.Div(id='selected-continents', children=[], style={'display': 'flex', 'flex-wrap': 'wrap'})
+            html.Div(id='selected-continents', children=[], style={'display': 'flex', 'flex-wrap': 'wrap'}),
+            dcc.Store(id='selected-continents-store', data=[]),
         ], style={'display': 'block'}),
 
         dcc.Dropdown(
@@ -50,16 +55,66 @@ def get_layout():
             value='2020',
             clearable=False
         ),
+        dcc.RadioItems(
+            id='year-switching',
+            options=[
+                {'label': 'Смена года в браузере', 'value': 'client'},
+                {'label': 'Смена года на сервере', 'value': 'server'}
+            ],
+            value='client',
+            labelStyle={'display': 'inline-block'}
+        ),
+        dcc.Store(id='map-years-data'),
+        dcc.Store(id='map-render-year'),
 
-        dcc.Graph(id='world-map'),
+        dcc.Graph(id='world-map', config={'topojsonURL': topojson_url()}),
     ])
 
 
+def encode_matrix(values, dtype):
+    # Матрица передается в браузер одним base64-блоком little-endian
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'shape': list(values.shape), 'data': base64.b64encode(values.tobytes()).decode('ascii')}
+
+
+def encode_rates(rates):
+    # Проценты с точностью до сотых помещаются в int16, пропуски кодируются минимальным значением
+    hundredths = np.round(np.asarray(rates, dtype=np.float64) * 100)
+    return encode_matrix(np.where(np.isnan(hundredths), np.iinfo(np.int16).min, hundredths), 'int16')
+
+
+def year_matrix_payload(dataset, view_mode, selected_continents):
+    columns = [dataset.year_index[year] for year in years]
+    rows = np.arange(len(dataset.countries))
+    if view_mode == 'countries' and selected_continents:
+        rows = rows[dataset.countries['Continent'].isin(selected_continents).to_numpy()]
+    countries = dataset.countries.iloc[rows]
+
+    payload = {
+        'key': [view_mode, selected_continents],
+        'years': years,
+        'locations': countries['Country Code'].tolist(),
+        'names': countries['Country Name'].tolist(),
+        'continents': countries['Continent'].tolist(),
+        'rates': encode_rates(dataset.rates[np.ix_(rows, columns)]),
+        'population': encode_matrix(dataset.population[np.ix_(rows, columns)], 'float32'),
+    }
+    if view_mode == 'continents':
+        payload.update({
+            'continent_names': dataset.continents,
+            'continent_codes': dataset.continent_codes[rows].tolist(),
+            'continent_rates': encode_rates(dataset.continent_cube['Unemployment_Rate'][:, columns]),
+            'continent_population': encode_matrix(dataset.continent_cube['Total_Population'][:, columns], 'float32'),
+        })
+    return payload
+
+
 def register_callbacks(app):
     @app.callback(
         Output('continent-form', 'style'),
         Input('view-mode', 'value')
     )
+    @instrument('toggle_continent_filter')
     def toggle_continent_filter(view_mode):
         if view_mode == 'countries':
             return {'display': 'block'}
@@ -67,157 +122,238 @@ def register_callbacks(app):
             return {'display': 'none'}
 
     @app.callback(
-        Output('selected-continents', 'children'),
+        Output('selected-continents-store', 'data'),
         Input('add-button', 'n_clicks'),
         Input({'type': 'remove-button', 'index': ALL}, 'n_clicks'),
         State('continent-dropdown', 'value'),
-        State('selected-continents', 'children')
+        State('selected-continents-store', 'data')
     )
+    @instrument('manage_continents')
     def manage_continents(add_clicks, remove_clicks, selected_continent, selected_continents):
         ctx = callback_context
-        if not ctx.triggered:
-            return selected_continents
-
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-
-        if 'add-button' in button_id:
-            if selected_continent and selected_continent not in [continent['props']['children'][0]['props']['children']
-                                                                 for continent in selected_continents]:
-                selected_continents.append(
-                    html.Div([
-                        html.Span(selected_continent, style={'margin-right': '10px'}),
-                        dbc.Button('Удалить', id={'type': 'remove-button', 'index': selected_continent}, color='danger',
-                                   size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
-                    ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px',
-                              'margin-bottom': '5px'})
-                )
-        else:
-            button_index = eval(button_id)['index']
-            selected_continents = [continent for continent in selected_continents if
-                                   continent['props']['children'][0]['props']['children'] != button_index]
+        # Появление новых кнопок удаления тоже вызывает callback, но без нажатия
+        if not ctx.triggered or not ctx.triggered[0]['value']:
+            return no_update
+
+        if ctx.triggered_id == 'add-button':
+            if not selected_continent or selected_continent in selected_continents:
+                return no_update
+            return selected_continents + [selected_continent]
+        return [continent for continent in selected_continents if continent != ctx.triggered_id['index']]
+
+    @app.callback(
+        Output('selected-continents', 'children'),
+        Input('selected-continents-store', 'data')
+    )
+    @instrument('render_selected_continents')
+    def render_selected_continents(selected_continents):
+        return [
+            html.Div([
+                html.Span(continent, style={'margin-right': '10px'}),
+                dbc.Button('Удалить', id={'type': 'remove-button', 'index': continent}, color='danger',
+                           size='sm', n_clicks=0, style={'font-size': '10px', 'padding': '2px 5px'})
+            ], style={'display': 'flex', 'align-items': 'center', 'margin-right': '10px',
+                      'margin-bottom': '5px'})
+            for continent in selected_continents
+        ]
+
+    # Смена года сначала обрабатывается в браузере: при загруженной матрице всех лет
+    # подменяются только значения фигуры, иначе год передается на сервер
+    app.clientside_callback(
+        ClientsideFunction(namespace='worldmap', function_name='switch_year'),
+        Output('world-map', 'figure', allow_duplicate=True),
+        Output('map-render-year', 'data'),
+        Input('year-dropdown', 'value'),
+        State('year-switching', 'value'),
+        State('map-years-data', 'data'),
+        State('world-map', 'figure'),
+        prevent_initial_call='initial_duplicate'
+    )
+
+    @app.callback(
+        Output('map-years-data', 'data'),
+        Input('view-mode', 'value'),
+        Input('selected-continents-store', 'data'),
+        Input('year-switching', 'value'),
+    )
+    @instrument('load_map_years')
+    def load_map_years(view_mode, selected_continents, year_switching):
+        if year_switching != 'client':
+            return None
+
+        view_mode, selected_continents = normalize_map_selection(view_mode, selected_continents)
+        key = ('years', view_mode, tuple(selected_continents))
 
-        return selected_continents
+        dataset = get_dataset()
+        payload = map_cache.get(key, dataset.version)
+        if payload is None:
+            payload = render_state(dataset, key)
+            map_cache.set(key, dataset.version, payload)
+        return payload
 
     @app.callback(
         Output('world-map', 'figure'),
         Input('view-mode', 'value'),
-        Input('selected-continents', 'children'),
-        Input('year-dropdown', 'value'),
+        Input('selected-continents-store', 'data'),
+        Input('map-render-year', 'data'),
+        State('year-dropdown', 'value'),
     )
-    def update_map(view_mode, selected_continents, selected_year):
+    @instrument('update_map')
+    def update_map(view_mode, selected_continents, render_year, selected_year):
+        view_mode, selected_continents = normalize_map_selection(view_mode, selected_continents)
+        key = (view_mode, tuple(selected_continents), selected_year)
 
-        selected_continents = [continent['props']['children'][0]['props']['children'] for continent in
-                               selected_continents]
+        dataset = get_dataset()
+        figure = map_cache.get(key, dataset.version)
+        if figure is None:
+            figure = render_state(dataset, key)
+            map_cache.set(key, dataset.version, figure)
+        return figure
 
-        merged_df = df.merge(population[['Numeric code', selected_year]], how='left', on='Numeric code',
-                             suffixes=('', '_population'))
-        if view_mode == 'countries':
-            filtered_df = merged_df
-            if selected_continents:
-                filtered_df = merged_df[merged_df['Continent'].isin(selected_continents)]
-            text = [
-                f"Страна: {filtered_df['Country Name'][i]}<br>" \
-                f"Население: {filtered_df[f'{selected_year}_population'][i] / 10e2:.{1}f} млн<br>" \
-                f"Континент: {filtered_df['Continent'][i]}"
-                for i in filtered_df['Country Name'].index]
-
-            return show_map(selected_year, filtered_df[['Country Name', 'Country Code', selected_year]], filtered_df['Country Code'],
-                            filtered_df[selected_year], text, view_mode)
-        else:
-            # Группировка по континентам и расчет процентной безработицы
-            merged_df['Unemployment_Count'] = merged_df[selected_year] * merged_df[f'{selected_year}_population'] / 100
-            continent_df = merged_df.groupby('Continent').agg(
-                Total_Unemployment=pd.NamedAgg(column='Unemployment_Count', aggfunc='sum'),
-                Total_Population=pd.NamedAgg(column=f'{selected_year}_population', aggfunc='sum')
-            ).reset_index()
-            continent_df['Unemployment_Rate'] = round(
-                (continent_df['Total_Unemployment'] / continent_df['Total_Population']) * 100, 2)
-
-            # Дублирование данных континентов для каждой страны в них
-            continent_countries = merged_df[['Continent', 'Country Code', 'Country Name', selected_year,
-                                             f'{selected_year}_population']].drop_duplicates()
-            continent_df = pd.merge(continent_countries, continent_df, on='Continent')
-
-            text = [
-                f"Страна: {continent_df['Country Name'][i]}<br>" \
-                f"Локальная безработица: {continent_df[selected_year][i]}%<br>" \
-                f"Население страны: {continent_df[f'{selected_year}_population'][i] / 10e2:.{1}f} млн<br>"
-                f"Континент: {continent_df['Continent'][i]}<br>" \
-                f"Население континента: {continent_df['Total_Population'][i] / 10e2:.{1}f} млн<br>" \
-                for i in continent_df['Country Name'].index]
-            return show_map(selected_year, continent_df[['Continent', 'Unemployment_Rate']].drop_duplicates(),
-                            continent_df['Country Code'],
-                            continent_df['Unemployment_Rate'], text, view_mode)
-
-    def show_map(selected_year, scatter_info, location_column, coloring_column, text_column, view_mode):
-
-        fig = go.Figure(data=go.Choropleth(
-            locations=location_column,
-            z=coloring_column,
-            text=text_column,
-            hoverinfo='location+text',
-            colorscale='plasma',
-            autocolorscale=False,
-            reversescale=True,
-            marker_line_color='darkgray',
-            marker_line_width=0.5,
-            colorbar_ticksuffix='%',
-            colorbar_title='Процент <br>безработицы %',
+
+def cached_states(dataset):
+    # Состояния без выбора континентов, которые команда прогрева готовит заранее
+    keys = [('years', view_mode, ()) for view_mode in ('countries', 'continents')]
+    keys += [(view_mode, (), year) for view_mode in ('countries', 'continents') for year in years]
+    return keys
+
+
+def render_state(dataset, key):
+    if key[0] == 'years':
+        return year_matrix_payload(dataset, key[1], list(key[2]))
+    view_mode, selected_continents, selected_year = key
+    fig = render_map(dataset, view_mode, list(selected_continents), selected_year)
+    # По ключу браузер проверяет, что матрица лет относится к текущей фигуре
+    fig.update_layout(meta={'key': [view_mode, list(selected_continents)]})
+    return fig
+
+
+def normalize_map_selection(view_mode, selected_continents):
+    # В режиме континентов выбор континентов на карту не влияет
+    if view_mode == 'countries':
+        return view_mode, sorted(set(selected_continents))
+    return view_mode, []
+
+
+def to_millions(population):
+    # Округление половин вверх, как Math.round при смене года в браузере
+    return np.floor(population / 100 + 0.5) / 10
+
+
+def render_map(dataset, view_mode, selected_continents, selected_year):
+    merged_df = dataset.frame([selected_year], with_population=True)
+    # Население передается числом в миллионах, подписи собирает hovertemplate в браузере
+    merged_df['Population'] = to_millions(merged_df[f'{selected_year}_population'])
+    if view_mode == 'countries':
+        filtered_df = merged_df
+        if selected_continents:
+            filtered_df = merged_df[merged_df['Continent'].isin(selected_continents)]
+        return show_map(selected_year, filtered_df[['Country Name', 'Country Code', selected_year]], filtered_df['Country Code'],
+                        filtered_df[selected_year], filtered_df['Country Name'],
+                        filtered_df[['Population', 'Continent']], country_hovertemplate, view_mode)
+    else:
+        # Показатели континентов берутся из предрасчитанного куба,
+        # для стран передается только население континента
+        continent_stats = dataset.continent_stats(selected_year)
+        continent_df = merged_df
+        continent_df['Total_Population'] = to_millions(continent_stats['Total_Population'].to_numpy())[dataset.continent_codes]
+        continent_df['Unemployment_Rate'] = continent_stats['Unemployment_Rate'].to_numpy()[dataset.continent_codes]
+        return show_map(selected_year, continent_stats[['Continent', 'Unemployment_Rate']],
+                        continent_df['Country Code'], continent_df['Unemployment_Rate'], continent_df['Country Name'],
+                        continent_df[[selected_year, 'Population', 'Continent', 'Total_Population']],
+                        continent_hovertemplate, view_mode)
+
+
+country_hovertemplate = (
+    '%{location}<br>'
+    'Страна: %{text}<br>'
+    'Население: %{customdata[0]:.1f} млн<br>'
+    'Континент: %{customdata[1]}<extra></extra>'
+)
+
+continent_hovertemplate = (
+    '%{location}<br>'
+    'Страна: %{text}<br>'
+    'Локальная безработица: %{customdata[0]}%<br>'
+    'Население страны: %{customdata[1]:.1f} млн<br>'
+    'Континент: %{customdata[2]}<br>'
+    'Население континента: %{customdata[3]:.1f} млн<extra></extra>'
+)
+
+
+def show_map(selected_year, scatter_info, location_column, coloring_column, name_column, hover_data, hovertemplate, view_mode):
+
+    fig = go.Figure(data=go.Choropleth(
+        locations=location_column,
+        z=coloring_column,
+        text=name_column,
+        customdata=hover_data,
+        hovertemplate=hovertemplate,
+        colorscale='plasma',
+        autocolorscale=False,
+        reversescale=True,
+        marker_line_color='darkgray',
+        marker_line_width=0.5,
+        colorbar_ticksuffix='%',
+        colorbar_title='Процент <br>безработицы %',
+    ))
+
+    fig.update_geos(
+        visible=True,
+        projection=dict(
+            type='conic conformal',
+            parallels=[0, 0],
+            rotation={'lat': 15, 'lon': 0},
+            scale=2 if view_mode == 'countries' else 0.7,
+        ),
+        lonaxis={'range': [30, 180]},
+        lataxis={'range': [15, 75]}
+    )
+
+    if view_mode == 'countries':
+        fig.add_trace(go.Scattergeo(
+            locations=scatter_info['Country Code'],
+            mode='text',
+            hoverinfo='skip',
+            text=scatter_info['Country Name'],
+            customdata=scatter_info[selected_year],
+            texttemplate='%{text}<br>%{customdata}%',
+            textfont={'color': 'black'},
+            hoverlabel=dict(namelength=0),
+            name='',
+        ))
+    else:
+        fig.add_trace(go.Scattergeo(
+            lon=[continents_coordinates[continent][1] for continent in scatter_info['Continent']],
+            lat=[continents_coordinates[continent][0] for continent in scatter_info['Continent']],
+            mode='text',
+            hoverinfo='skip',
+            text=scatter_info['Continent'],
+            customdata=scatter_info['Unemployment_Rate'],
+            texttemplate='%{text}<br>%{customdata}%',
+            textfont={'size': 18, 'color': 'black'},
+            hoverlabel=dict(namelength=0),
+            name='',
         ))
 
-        fig.update_geos(
-            visible=True,
-            projection=dict(
-                type='conic conformal',
-                parallels=[0, 0],
-                rotation={'lat': 15, 'lon': 0},
-                scale=2 if view_mode == 'countries' else 0.7,
-            ),
-            lonaxis={'range': [30, 180]},
-            lataxis={'range': [15, 75]}
-        )
+    fig.update_layout(
+        title_text=f'Уровень безработицы в {selected_year} году',
+        width=1380,
+        height=720,
+        geo=dict(
+            showframe=False,
+            showcoastlines=False,
+            projection_type='equirectangular'
+        ),
+        annotations=[dict(
+            x=0.5,
+            y=-0.05,
+            xref='paper',
+            yref='paper',
+            text='Source: <a href="https://www.kaggle.com/datasets/pantanjali/unemployment-dataset">Country\'s '
+                 'unemployment rate from past 31 years</a>',
+            showarrow=False
+        )],
+    )
 
-        if view_mode == 'countries':
-            fig.add_trace(go.Scattergeo(
-                locations=scatter_info['Country Code'],
-                mode='text',
-                hoverinfo='skip',
-                text=['{}<br>{}%'.format(k, v) for k, v in zip(scatter_info['Country Name'], scatter_info[selected_year])],
-                textfont={'color': 'black'},
-                hoverlabel=dict(namelength=0),
-                name='',
-            ))
-        else:
-            fig.add_trace(go.Scattergeo(
-                lon=[continents_coordinates[continent][1] for continent in scatter_info['Continent']],
-                lat=[continents_coordinates[continent][0] for continent in scatter_info['Continent']],
-                mode='text',
-                hoverinfo='skip',
-                text=['{}<br>{}%'.format(k, v) for k, v in
-                      zip(scatter_info['Continent'], scatter_info['Unemployment_Rate'])],
-                textfont={'size': 18, 'color': 'black'},
-                hoverlabel=dict(namelength=0),
-                name='',
-            ))
-
-        fig.update_layout(
-            title_text=f'Уровень безработицы в {selected_year} году',
-            width=1380,
-            height=720,
-            geo=dict(
-                showframe=False,
-                showcoastlines=False,
-                projection_type='equirectangular'
-            ),
-            annotations=[dict(
-                x=0.5,
-                y=-0.05,
-                xref='paper',
-                yref='paper',
-                text='Source: <a href="https://www.kaggle.com/datasets/pantanjali/unemployment-dataset">Country\'s '
-                     'unemployment rate from past 31 years</a>',
-                showarrow=False
-            )],
-        )
-
-        return fig
+    return fig
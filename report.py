@@ -0,0 +1,224 @@
+import argparse
+import concurrent.futures
+import html
+import json
+import logging
+import os
+import re
+import time
+
+from dash.development.base_component import Component
+from plotly.offline import get_plotlyjs
+
+import data
+import geo_assets
+from cache import BASE_DIR, atomic_write, code_version
+from pages import bar_charts, charts, worldmap
+
+REPORT_DIR = os.environ.get('REPORT_DIR', os.path.join(BASE_DIR, 'report'))
+MANIFEST = 'manifest.json'
+PLOTLYJS = 'plotly.min.js'
+GEO_ASSETS = 'geo_assets.js'
+# Страница отчета пересобирается при изменении данных или кода, который ее строит
+SOURCES = (__file__, data.__file__, worldmap.__file__, bar_charts.__file__, charts.__file__)
+
+logger = logging.getLogger(__name__)
+
+page_template = '''<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{scripts}
+<style>
+body {{ font-family: sans-serif; margin: 20px 40px; }}
+.table {{ border-collapse: collapse; margin: 10px 0; }}
+.table th, .table td {{ border: 1px solid #dee2e6; padding: 4px 12px; }}
+</style>
+</head>
+<body>
+<p><a href="{root}index.html">Оглавление</a></p>
+<h1>{title}</h1>
+{body}
+<p>Версия данных: {version}</p>
+</body>
+</html>
+'''
+
+
+def slug(name):
+    return re.sub(r'[^\w-]+', '_', str(name)).strip('_')
+
+
+def views(dataset):
+    # Все представления отчета: путь файла и ключ, по которому рабочий процесс строит страницу
+    result = {}
+    for view_mode in ('countries', 'continents'):
+        for year in worldmap.years:
+            result[f'map/{view_mode}-{year}.html'] = ('map', view_mode, year)
+    for year in bar_charts.years:
+        result[f'rankings/{year}.html'] = ('ranking', year)
+        for continent in dataset.continent_rows:
+            result[f'continents/{slug(continent)}-{year}.html'] = ('continent', continent, year)
+    for country in dataset.country_index:
+        result[f'countries/{slug(country)}.html'] = ('country', country)
+    return result
+
+
+def component_html(component):
+    # Таблицы страниц собраны из компонентов dash.html, в отчете они записываются обычной разметкой
+    if component is None:
+        return ''
+    if isinstance(component, (list, tuple)):
+        return ''.join(component_html(child) for child in component)
+    if not isinstance(component, Component):
+        return html.escape(str(component))
+    props = component.to_plotly_json()['props']
+    tag = type(component).__name__.lower()
+    attributes = ''
+    if props.get('className'):
+        attributes += f' class="{html.escape(props["className"])}"'
+    if props.get('style'):
+        style = '; '.join(f'{name}: {value}' for name, value in props['style'].items())
+        attributes += f' style="{html.escape(style)}"'
+    return f'<{tag}{attributes}>{component_html(props.get("children"))}</{tag}>'
+
+
+def figure_html(fig, config=None):
+    return fig.to_html(full_html=False, include_plotlyjs=False, config=config)
+
+
+def render_body(dataset, key, topojson_url):
+    kind = key[0]
+    if kind == 'map':
+        view_mode, year = key[1:]
+        fig = worldmap.render_map(dataset, view_mode, [], year)
+        title = f'Карта безработицы: {"страны" if view_mode == "countries" else "континенты"}, {year}'
+        return title, figure_html(fig, {'topojsonURL': topojson_url} if topojson_url else None)
+    if kind == 'ranking':
+        year = key[1]
+        table = bar_charts.build_top_countries_global_table(bar_charts.get_top_countries_global(dataset, year), year)
+        return f'Топ-10 стран по безработице в {year}', component_html(table)
+    if kind == 'continent':
+        continent, year = key[1:]
+        df_filtered = bar_charts.get_continent_slice(dataset, continent, year)
+        table = bar_charts.build_top_countries_continent_table(
+            bar_charts.get_top_countries_continent(dataset, continent, year), year)
+        return f'{continent}, {year}', ''.join([
+            component_html(table),
+            figure_html(bar_charts.build_deviation_bar_chart(dataset, continent, year, df_filtered)),
+            figure_html(bar_charts.build_change_deviation_bar_chart(dataset, continent, year, df_filtered)),
+        ])
+    country = key[1]
+    line_fig, _, bar_fig = charts.build_charts(dataset, [country], [1991, 2020])
+    return f'Динамика безработицы: {country}', figure_html(line_fig) + figure_html(bar_fig)
+
+
+def render_view(output, name, key, topojson_url, inline_plotlyjs):
+    # HTML страницы не пересылается через пул: для итогового лога достаточно размера файла
+    dataset = data.get_dataset()
+    title, body = render_body(dataset, key, topojson_url)
+    root = '../' * name.count('/')
+    if inline_plotlyjs:
+        scripts = f'<script>{get_plotlyjs()}</script>'
+    else:
+        scripts = f'<script src="{root}{PLOTLYJS}"></script>'
+    if key[0] == 'map' and topojson_url is None:
+        if inline_plotlyjs:
+            with open(os.path.join(output, GEO_ASSETS), encoding='utf-8') as file:
+                scripts += f'\n<script>{file.read()}</script>'
+        else:
+            scripts += f'\n<script src="{root}{GEO_ASSETS}"></script>'
+    page = page_template.format(title=html.escape(title), scripts=scripts, root=root, body=body,
+                                version=html.escape(str(dataset.version)))
+    atomic_write(os.path.join(output, name), page)
+    return len(page)
+
+
+def write_geo_assets(output):
+    # Браузер не загружает файлы геометрии по file://, поэтому они встраиваются скриптом,
+    # который plotly.js читает из window.PlotlyGeoAssets; без локальных файлов карта обращается к CDN
+    if geo_assets.topojson_version() is None:
+        logger.warning('Нет файлов геометрии в %s, карты отчета загрузят их с %s',
+                       geo_assets.TOPOJSON_DIR, geo_assets.CDN_URL)
+        return geo_assets.CDN_URL
+    topojson = {}
+    for name in geo_assets.TOPOJSON_FILES:
+        with open(os.path.join(geo_assets.TOPOJSON_DIR, name), encoding='utf-8') as file:
+            topojson[os.path.splitext(name)[0]] = json.load(file)
+    atomic_write(os.path.join(output, GEO_ASSETS),
+                 f'window.PlotlyGeoAssets = {{topojson: {json.dumps(topojson, separators=(",", ":"))}}};\n')
+    return None
+
+
+def write_index(output, dataset, names):
+    sections = {'map': 'Карта безработицы', 'rankings': 'Топ-10 стран по годам',
+                'continents': 'Континенты по годам', 'countries': 'Динамика по странам'}
+    body = ''
+    for section, title in sections.items():
+        links = ''.join(f'<li><a href="{html.escape(name)}">{html.escape(os.path.splitext(name.split("/", 1)[1])[0])}'
+                        f'</a></li>' for name in names if name.startswith(f'{section}/'))
+        body += f'<h2>{title}</h2>\n<ul>{links}</ul>\n'
+    atomic_write(os.path.join(output, 'index.html'), page_template.format(
+        title='Отчет по безработице', scripts='', root='', body=body, version=html.escape(str(dataset.version))))
+
+
+def read_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST), encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build_report(output=REPORT_DIR, workers=None, force=False, inline_plotlyjs=False):
+    dataset = data.get_dataset()
+    fingerprint = f'{dataset.version}-{code_version(SOURCES)}-{geo_assets.topojson_version()}-{int(inline_plotlyjs)}'
+    manifest = {} if force else read_manifest(output)
+    expected = views(dataset)
+
+    # Страницы, которых больше нет в данных, удаляются
+    for name in set(manifest) - set(expected):
+        if os.path.exists(os.path.join(output, name)):
+            os.remove(os.path.join(output, name))
+        del manifest[name]
+
+    topojson_url = write_geo_assets(output)
+    if not inline_plotlyjs:
+        plotlyjs = get_plotlyjs()
+        path = os.path.join(output, PLOTLYJS)
+        if not os.path.exists(path) or os.path.getsize(path) != len(plotlyjs.encode()):
+            atomic_write(path, plotlyjs)
+
+    tasks = [(name, key) for name, key in expected.items()
+             if manifest.get(name) != fingerprint or not os.path.exists(os.path.join(output, name))]
+    start = time.perf_counter()
+    total_bytes = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=data.load_worker_dataset) as executor:
+            futures = {executor.submit(render_view, output, name, key, topojson_url, inline_plotlyjs): name
+                       for name, key in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                total_bytes += future.result()
+                manifest[futures[future]] = fingerprint
+    finally:
+        # Готовые страницы учитываются и при прерванном запуске, следующий продолжит с оставшихся
+        atomic_write(os.path.join(output, MANIFEST),
+                     json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True))
+    write_index(output, dataset, sorted(expected))
+    logger.info('Отчет %s: обновлено страниц %d из %d (%.1f МБ) за %.1f с', output, len(tasks), len(expected),
+                total_bytes / 2 ** 20, time.perf_counter() - start)
+    return len(tasks)
+
+
+if __name__ == '__main__':
+    # Статический снимок всех представлений дашборда для рассылки без обращения к рабочему приложению
+    parser = argparse.ArgumentParser(description='Статический HTML-отчет по всем годам, континентам и странам')
+    parser.add_argument('--output', default=REPORT_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help='перестроить все страницы')
+    parser.add_argument('--inline-plotlyjs', action='store_true',
+                        help='встроить plotly.js в каждую страницу, чтобы ее можно было открыть отдельно')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    build_report(args.output, args.workers, args.force, args.inline_plotlyjs)
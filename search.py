@@ -0,0 +1,57 @@
+import bisect
+import re
+from collections import Counter
+
+# Доля общих триграмм, начиная с которой название считается похожим на запрос
+MIN_SIMILARITY = 0.5
+
+SEPARATORS = re.compile(r'[\s,.()/\'-]+')
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # Поиск названий без учета регистра: сначала совпадения с началом названия, затем с началом
+    # любого слова; если таких нет, похожие по триграммам (опечатки, часть слова)
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [normalize(name) for name in self.names]
+        self.name_prefixes = sorted((key, row) for row, key in enumerate(self.keys))
+        self.word_prefixes = sorted((word, row) for row, key in enumerate(self.keys)
+                                    for word in SEPARATORS.split(key)[1:] if word)
+        self.trigrams = {}
+        for row, key in enumerate(self.keys):
+            for trigram in trigrams(f' {key} '):
+                self.trigrams.setdefault(trigram, []).append(row)
+
+    def _prefix_matches(self, prefixes, query, limit):
+        # Совпадения идут в отсортированном списке подряд, просматривается не больше limit записей
+        start = bisect.bisect_left(prefixes, (query,))
+        rows = []
+        for key, row in prefixes[start:start + limit]:
+            if not key.startswith(query):
+                break
+            rows.append(row)
+        return rows
+
+    def search(self, query, limit=20):
+        query = normalize(query)
+        if not query:
+            return []
+        rows = self._prefix_matches(self.name_prefixes, query, limit)
+        if len(rows) < limit:
+            words = set(self._prefix_matches(self.word_prefixes, query, limit)) - set(rows)
+            rows += sorted(words, key=self.keys.__getitem__)
+        if not rows and len(query) >= 3:
+            query_trigrams = trigrams(f' {query}')
+            counts = Counter(row for trigram in query_trigrams for row in self.trigrams.get(trigram, ()))
+            similar = [(-count, self.keys[row], row) for row, count in counts.items()
+                       if count / len(query_trigrams) >= MIN_SIMILARITY]
+            rows = [row for _, _, row in sorted(similar)]
+        return [self.names[row] for row in rows[:limit]]
@@ -0,0 +1,37 @@
+from cache import DiskCache, FigureCache
+
+
+def test_old_version_does_not_evict_new_values():
+    cache = FigureCache()
+    assert cache.get('map', 'v1') is None
+    cache.set('map', 'v1', 'old')
+    assert cache.get('map', 'v2') is None
+    cache.set('map', 'v2', 'new')
+
+    # Запрос, закрепленный на прежнем снимке, получает промах и ничего не сохраняет
+    assert cache.get('map', 'v1') is None
+    cache.set('map', 'v1', 'old')
+
+    assert cache.get('map', 'v2') == 'new'
+    assert cache.stats()['size'] == 1
+
+
+def test_new_version_clears_values():
+    cache = FigureCache()
+    cache.get('map', 'v1')
+    cache.set('map', 'v1', 'old')
+    assert cache.get('map', 'v2') is None
+    assert cache.get('map', 'v1') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_memory_tier_keeps_built_values(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.set('map', 'v1', {'data': [1, 2]})
+    cache = FigureCache(disk=disk)
+
+    # Значение с диска декодируется один раз, дальше отдается тот же объект из памяти
+    value = cache.get('map', 'v1')
+    assert value == {'data': [1, 2]}
+    assert cache.get('map', 'v1') is value
+    assert cache.stats()['disk_hits'] == 1
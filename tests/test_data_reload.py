@@ -0,0 +1,51 @@
+import os
+
+import flask
+import pandas as pd
+import pytest
+
+import data
+import data_reload
+
+
+@pytest.fixture
+def reload_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(data, '_dataset', None)
+    monkeypatch.setattr(data_reload, 'ADMIN_TOKEN', 'secret')
+    server = flask.Flask(__name__)
+    data_reload.init_app(server)
+    data.get_dataset()
+    return server.test_client()
+
+
+def replace_unemployment_csv(tmp_path, monkeypatch, column):
+    path = tmp_path / 'unemployment.csv'
+    pd.read_csv(data.UNEMPLOYMENT_PATH).drop(columns=[column]).to_csv(path, index=False)
+    monkeypatch.setattr(data, 'UNEMPLOYMENT_PATH', str(path))
+
+
+@pytest.mark.parametrize('column', ['Numeric code', 'Continent', 'Country Name', '2020'])
+def test_reload_rejects_csv_without_required_column(reload_client, tmp_path, monkeypatch, column):
+    version = data.get_dataset().version
+    cached = sorted(os.listdir(data.CACHE_DIR))
+    replace_unemployment_csv(tmp_path, monkeypatch, column)
+
+    response = reload_client.post('/admin/reload-data', headers={'Authorization': 'Bearer secret'})
+
+    assert response.status_code == 422
+    assert column in response.get_json()['error']
+    # Дашборд остается на прежнем снимке, отклоненные данные не попадают в кэш
+    assert data.get_dataset().version == version
+    assert sorted(os.listdir(data.CACHE_DIR)) == cached
+
+
+def test_reload_accepts_valid_csv(reload_client, tmp_path, monkeypatch):
+    path = tmp_path / 'unemployment.csv'
+    pd.read_csv(data.UNEMPLOYMENT_PATH).to_csv(path, index=False)
+    monkeypatch.setattr(data, 'UNEMPLOYMENT_PATH', str(path))
+
+    response = reload_client.post('/admin/reload-data', headers={'Authorization': 'Bearer secret'})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'reloaded': True, 'version': data.source_version()}
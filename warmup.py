@@ -0,0 +1,53 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import time
+
+import data
+from pages import bar_charts, worldmap
+
+# Страницы, у которых есть дисковый кэш и фиксированный набор состояний
+pages = {
+    'worldmap': (worldmap, worldmap.map_cache),
+    'bar_charts': (bar_charts, bar_charts.bar_cache),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def render_state(page, key):
+    module, cache = pages[page]
+    dataset = data.get_dataset()
+    return cache.disk.set(key, dataset.version, module.render_state(dataset, key))
+
+
+def warm(workers=None, force=False):
+    dataset = data.get_dataset()
+    tasks = []
+    for page, (module, cache) in pages.items():
+        if cache.disk is None:
+            logger.warning('Дисковый кэш отключен (RENDER_CACHE_DIR), прогрев пропущен')
+            return 0
+        cache.disk.prune(dataset.version)
+        tasks += [(page, key) for key in module.cached_states(dataset)
+                  if force or cache.disk.get(key, dataset.version) is None]
+
+    start = time.perf_counter()
+    total_bytes = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=data.load_worker_dataset) as executor:
+        for size in executor.map(render_state, *zip(*tasks), chunksize=4) if tasks else ():
+            total_bytes += size
+    logger.info('Подготовлено состояний: %d (%.1f МБ) за %.1f с', len(tasks), total_bytes / 2 ** 20,
+                time.perf_counter() - start)
+    return len(tasks)
+
+
+if __name__ == '__main__':
+    # Прогрев после развертывания: все состояния карты и страницы континентов рендерятся заранее
+    parser = argparse.ArgumentParser(description='Прогрев дискового кэша фигур')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help='перерисовать уже подготовленные состояния')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    warm(args.workers, args.force)